@@ -0,0 +1,511 @@
+#!/usr/bin/env python3
+# Copyright (c) 2014-2015 Cedric Bellegarde <cedric.bellegarde@adishatz.org>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+    Collection scanner benchmark
+
+    Generate synthetic libraries of tagged FLAC files and scan them into a
+    temporary database, reporting for cold scans, no-op rescans and retag
+    scans: files/s, SQL statements, commits and peak RSS.
+    Each library size runs in its own process.
+    With --check-plans, queries run by per id accessors are checked to
+    never scan a whole table.
+    With --check-stats, an album is renamed and its popularity must be
+    kept by the new album.
+
+    $ ./benchmarks/scan_benchmark.py --sizes 1000,10000,100000
+"""
+
+import os
+import sys
+import json
+import shutil
+import struct
+import argparse
+import tempfile
+import subprocess
+from threading import current_thread
+from time import perf_counter
+
+# Never touch user settings
+os.environ['GSETTINGS_BACKEND'] = 'memory'
+
+_SRC_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         "..", "src")
+_SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            "..", "data", "org.gnome.Lollypop.gschema.xml")
+
+
+class SyntheticLibrary:
+    """
+        Tagged FLAC files, headers only: no audio frames are written, tag
+        readers never need to decode anything
+    """
+
+    def __init__(self, path, tracks, artists, albums, genres):
+        """
+            Init library
+            @param path as str
+            @param tracks as int
+            @param artists as int
+            @param albums as int
+            @param genres as int
+        """
+        self.path = path
+        self.tracks = tracks
+        self._artists = max(1, artists)
+        self._albums = max(1, albums)
+        self._genres = max(1, genres)
+        self._files = []
+        # Album index: name, for renamed albums
+        self._album_names = {}
+
+    def create(self):
+        """
+            Write library files
+        """
+        for i in range(0, self.tracks):
+            album = i % self._albums
+            artist = album % self._artists
+            filepath = os.path.join(self.path,
+                                    "Artist %04d" % artist,
+                                    "Album %05d" % album,
+                                    "%03d.flac" % (i // self._albums))
+            self._files.append(filepath)
+            self._write(filepath, i, "Title %d" % i)
+
+    def retag(self, ratio):
+        """
+            Change title of some files, like a tag editor: write a new file
+            and rename it over the old one
+            @param ratio as float
+            @return retagged files count as int
+        """
+        count = int(len(self._files) * ratio)
+        step = max(1, len(self._files) // max(1, count))
+        retagged = 0
+        for i in range(0, len(self._files), step)[:count]:
+            filepath = self._files[i]
+            tmp = filepath + ".tmp"
+            self._write(tmp, i, "Retagged title %d" % i)
+            os.replace(tmp, filepath)
+            retagged += 1
+        return retagged
+
+    def rename_album(self, album, name):
+        """
+            Change album name of all its files, like retag()
+            @param album as int, album index
+            @param name as str
+            @return album files as [str]
+        """
+        self._album_names[album] = name
+        files = []
+        for i in range(album, len(self._files), self._albums):
+            filepath = self._files[i]
+            tmp = filepath + ".tmp"
+            self._write(tmp, i, "Title %d" % i)
+            os.replace(tmp, filepath)
+            files.append(filepath)
+        return files
+
+#######################
+# PRIVATE             #
+#######################
+    def _write(self, filepath, i, title):
+        """
+            Write a FLAC file with STREAMINFO and VORBIS_COMMENT blocks
+            @param filepath as str
+            @param i as int, track index
+            @param title as str
+        """
+        album = i % self._albums
+        artist = album % self._artists
+        comments = [("TITLE", title),
+                    ("ARTIST", "Artist %04d" % artist),
+                    ("ALBUM", self._album_names.get(album,
+                                                    "Album %05d" % album)),
+                    ("GENRE", "Genre %03d" % (album % self._genres)),
+                    ("TRACKNUMBER", "%d" % (i // self._albums + 1)),
+                    ("DATE", "%d" % (1950 + album % 70))]
+        vendor = b"lollypop benchmark"
+        comment = struct.pack("<I", len(vendor)) + vendor +\
+            struct.pack("<I", len(comments))
+        for (key, value) in comments:
+            data = ("%s=%s" % (key, value)).encode("utf-8")
+            comment += struct.pack("<I", len(data)) + data
+        # 44.1kHz, stereo, 16 bits, 180s + i % 120
+        samples = 44100 * (180 + i % 120)
+        value = (44100 << 44) | (1 << 41) | (15 << 36) | samples
+        streaminfo = struct.pack(">HHII", 4096, 4096, 0, 0)[:10] +\
+            struct.pack(">Q", value) + b"\x00" * 16
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        with open(filepath, "wb") as f:
+            f.write(b"fLaC")
+            f.write(struct.pack(">I", len(streaminfo)))
+            f.write(streaminfo)
+            f.write(struct.pack(">I", 0x84000000 | len(comment)))
+            f.write(comment)
+
+
+class QueryCounter:
+    """
+        Count SQL statements run on traced connections
+    """
+
+    def __init__(self):
+        """
+            Init counter
+        """
+        self.statements = 0
+        self.commits = 0
+        # Statements run, if recording
+        self.recorded = None
+
+    def trace(self, statement):
+        """
+            sqlite3 trace callback
+            @param statement as str
+        """
+        self.statements += 1
+        if statement.startswith("COMMIT"):
+            self.commits += 1
+        if self.recorded is not None:
+            self.recorded.append(statement)
+
+    def reset(self):
+        """
+            Reset counters
+        """
+        self.statements = 0
+        self.commits = 0
+
+
+class Benchmark:
+    """
+        Scan a synthetic library with a headless lollypop
+    """
+
+    def __init__(self, tmp):
+        """
+            Init headless application, database and scanner
+            @param tmp as str, working directory
+        """
+        from gi.repository import Gst
+        from lollypop.application_scan import ScanApplication
+        from lollypop.settings import Settings
+        from lollypop.database import Database
+        from lollypop.database_writer import DatabaseWriter
+        from lollypop.sqlcursor import SqlCursor
+        from lollypop.database_albums import AlbumsDatabase
+        from lollypop.database_artists import ArtistsDatabase
+        from lollypop.database_genres import GenresDatabase
+        from lollypop.database_tracks import TracksDatabase
+        from lollypop.background import BackgroundPolicy
+        from lollypop.tagreader import TagReader
+        from lollypop.collectionscanner import CollectionScanner
+
+        self.counter = QueryCounter()
+        counter = self.counter
+
+        class TracedDatabase(Database):
+            """
+                Temporary database counting statements
+            """
+            LOCAL_PATH = tmp
+            DB_PATH = os.path.join(tmp, "lollypop.db")
+
+            def get_cursor(self):
+                """
+                    Return a new traced sqlite cursor
+                """
+                sql = Database.get_cursor(self)
+                sql.set_trace_callback(counter.trace)
+                return sql
+
+        TagReader._EMBEDDED_PATH = os.path.join(tmp, "embedded")
+        Gst.init(None)
+        app = ScanApplication()
+        app.set_default()
+        app.settings = Settings.new()
+        app.db = TracedDatabase()
+        SqlCursor.add(app.db)
+        app.writer = DatabaseWriter(app.db)
+        app.albums = AlbumsDatabase()
+        app.artists = ArtistsDatabase()
+        app.genres = GenresDatabase()
+        app.tracks = TracksDatabase()
+        app.background = BackgroundPolicy()
+        app.scanner = CollectionScanner(False)
+        self.app = app
+
+    def run(self, name, library):
+        """
+            Scan library and measure
+            @param name as str
+            @param library as SyntheticLibrary
+            @return {}
+        """
+        from gi.repository import GLib
+        scanner = self.app.scanner
+        self._reset_peak_rss()
+        self.counter.reset()
+        start = perf_counter()
+        scanner._thread = current_thread()
+        scanner._missing_codecs = None
+        scanner._scan([library.path])
+        elapsed = perf_counter() - start
+        # Run scanner notifications
+        context = GLib.MainContext.default()
+        while context.pending():
+            context.iteration(False)
+        return {"size": library.tracks,
+                "scan": name,
+                "seconds": elapsed,
+                "files/s": library.tracks / elapsed if elapsed else 0,
+                "discovered": scanner.stats.discovered,
+                "statements": self.counter.statements,
+                "commits": self.counter.commits,
+                "peak rss": self._get_peak_rss()}
+
+    def check_plans(self):
+        """
+            Run per id accessors on scanned collection and check their
+            queries use indexes
+            @return [(statement as str, plan as [str])], full table scans
+        """
+        from lollypop.sqlcursor import SqlCursor
+        from lollypop.database_search import SearchDatabase
+        app = self.app
+        track_id = app.tracks.get_ids()[0]
+        album_id = app.tracks.get_album_id(track_id)
+        artist_id = app.albums.get_artist_id(album_id)
+        genre_id = app.albums.get_genre_ids(album_id)[0]
+        accessors = [
+            (app.tracks.get_id_by_path, app.tracks.get_path(track_id)),
+            (app.tracks.get_id_by, app.tracks.get_name(track_id), album_id),
+            (app.tracks.get_artist_ids, track_id),
+            (app.tracks.get_artist_names, track_id),
+            (app.tracks.get_genre_ids, track_id),
+            (app.tracks.get_genre_names, track_id),
+            (app.tracks.get_album_artist_id, track_id),
+            (app.tracks.get_rows, [track_id]),
+            (app.albums.get_id, app.albums.get_name(album_id), artist_id,
+             app.albums.get_year(album_id)),
+            (app.albums.get_rows, [album_id]),
+            (app.albums.get_genre_ids, album_id),
+            (app.albums.get_tracks, album_id, None),
+            (app.albums.get_tracks, album_id, genre_id),
+            (app.albums.get_tracks_path, album_id, genre_id),
+            (app.albums.get_discs, album_id, genre_id),
+            (app.albums.get_disc_tracks_ids, album_id, genre_id, 0),
+            (app.albums.get_count, album_id, genre_id),
+            (app.albums.get_count_for_disc, album_id, genre_id, 0),
+            (app.albums.get_duration, album_id, genre_id),
+            (app.albums.get_ids, artist_id, None),
+            (app.albums.get_ids, artist_id, genre_id),
+            (app.albums.get_ids, None, genre_id),
+            (app.albums.get_compilations, genre_id),
+            (app.albums.is_compilation, album_id),
+            (app.artists.get_id, app.artists.get_name(artist_id)),
+            (app.artists.get_albums, artist_id),
+            (app.artists.get_compilations, artist_id),
+            (app.genres.get_id, app.genres.get_name(genre_id)),
+            (app.genres.get_albums, genre_id),
+            (SearchDatabase().search, app.artists.get_name(artist_id))]
+        self.counter.recorded = []
+        for accessor in accessors:
+            accessor[0](*accessor[1:])
+        statements = list(dict.fromkeys(self.counter.recorded))
+        self.counter.recorded = None
+        failures = []
+        with SqlCursor(app.db) as sql:
+            for statement in statements:
+                plan = [row[3] for row in sql.execute(
+                                    "EXPLAIN QUERY PLAN %s" % statement)]
+                for detail in plan:
+                    # SCAN table, not SCAN table USING INDEX
+                    if detail.startswith("SCAN ") and "USING" not in detail:
+                        failures.append((" ".join(statement.split()), plan))
+                        break
+        return failures
+
+    def check_stats(self, library):
+        """
+            Rename an album, scan library and check new album popularity
+            @param library as SyntheticLibrary
+            @return True if popularity kept
+        """
+        from lollypop.sqlcursor import SqlCursor
+        app = self.app
+        filepath = library.rename_album(0, "Renamed album")[0]
+        album_id = app.tracks.get_album_id(app.tracks.get_id_by_path(
+                                                                filepath))
+        with SqlCursor(app.db) as sql:
+            app.albums.set_popularity(album_id, 42)
+            sql.commit()
+        self.run("rename", library)
+        album_id = app.tracks.get_album_id(app.tracks.get_id_by_path(
+                                                                filepath))
+        return app.albums.get_name(album_id) == "Renamed album" and\
+            app.albums.get_popularity(album_id) == 42
+
+#######################
+# PRIVATE             #
+#######################
+    def _reset_peak_rss(self):
+        """
+            Reset peak RSS (Linux >= 4.0)
+        """
+        try:
+            with open("/proc/self/clear_refs", "w") as f:
+                f.write("5")
+        except:
+            pass
+
+    def _get_peak_rss(self):
+        """
+            Get peak RSS in KiB
+            @return int
+        """
+        try:
+            with open("/proc/self/status", "r") as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        return int(line.split()[1])
+        except:
+            pass
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def setup_source_tree(tmp):
+    """
+        Make lollypop modules and settings schema from source tree usable
+        @param tmp as str
+    """
+    if not os.path.exists(os.path.join(_SRC_PATH, "collectionscanner.py")):
+        return
+    os.symlink(os.path.abspath(_SRC_PATH), os.path.join(tmp, "lollypop"))
+    sys.path.insert(0, tmp)
+    if "GSETTINGS_SCHEMA_DIR" not in os.environ:
+        schemas = os.path.join(tmp, "schemas")
+        os.mkdir(schemas)
+        shutil.copy(_SCHEMA_PATH, schemas)
+        subprocess.check_call(["glib-compile-schemas", schemas])
+        os.environ["GSETTINGS_SCHEMA_DIR"] = schemas
+
+
+def run_size(args):
+    """
+        Run all scans for one library size, print results as json
+        @param args as argparse.Namespace
+    """
+    tmp = tempfile.mkdtemp(prefix="lollypop-benchmark-")
+    try:
+        setup_source_tree(tmp)
+        size = args.run
+        library = SyntheticLibrary(os.path.join(tmp, "music"), size,
+                                   args.artists or size // 50,
+                                   args.albums or size // 10,
+                                   args.genres)
+        library.create()
+        benchmark = Benchmark(tmp)
+        for (key, value) in args.set:
+            benchmark.app.settings.set_value(key, value)
+        results = [benchmark.run("cold", library),
+                   benchmark.run("rescan", library)]
+        if args.check_plans:
+            for failure in benchmark.check_plans():
+                print("PLAN %s" % json.dumps(failure))
+        library.retag(args.retag)
+        results.append(benchmark.run("retag", library))
+        if args.check_stats and not benchmark.check_stats(library):
+            print("STATS album popularity lost on rename")
+        for result in results:
+            print("RESULT %s" % json.dumps(result))
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def setting(value):
+    """
+        Parse a KEY=VALUE setting override
+        @param value as str
+        @return (key as str, GLib.Variant)
+    """
+    from gi.repository import GLib
+    (key, value) = value.split("=", 1)
+    if value in ["true", "false"]:
+        return (key, GLib.Variant("b", value == "true"))
+    return (key, GLib.Variant("i", int(value)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lollypop scan benchmark")
+    parser.add_argument("--sizes", default="1000,10000,100000",
+                        help="Library sizes in tracks, comma separated")
+    parser.add_argument("--artists", type=int, default=0,
+                        help="Artists count, default size / 50")
+    parser.add_argument("--albums", type=int, default=0,
+                        help="Albums count, default size / 10")
+    parser.add_argument("--genres", type=int, default=25,
+                        help="Genres count")
+    parser.add_argument("--retag", type=float, default=0.1,
+                        help="Ratio of files retagged before last scan")
+    parser.add_argument("--set", type=setting, action="append", default=[],
+                        metavar="KEY=VALUE",
+                        help="Override a setting, like scan-threads=4")
+    parser.add_argument("--check-plans", action="store_true",
+                        help="Fail if per id queries scan whole tables")
+    parser.add_argument("--check-stats", action="store_true",
+                        help="Fail if album stats are lost on rename")
+    parser.add_argument("--run", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.run is not None:
+        run_size(args)
+        return
+
+    columns = ["size", "scan", "seconds", "files/s", "discovered",
+               "statements", "commits", "peak rss"]
+    print("%8s %7s %9s %9s %10s %10s %8s %10s" % tuple(columns))
+    failed = False
+    for size in args.sizes.split(","):
+        argv = [sys.executable, os.path.abspath(__file__),
+                "--run", size] + sys.argv[1:]
+        output = subprocess.run(argv, stdout=subprocess.PIPE,
+                                universal_newlines=True)
+        if output.returncode != 0:
+            print("Scan of %s tracks failed" % size)
+            failed = True
+        for line in output.stdout.splitlines():
+            if line.startswith("PLAN "):
+                (statement, plan) = json.loads(line[5:])
+                print("Full table scan: %s\n    %s" % (statement,
+                                                       ", ".join(plan)))
+                failed = True
+                continue
+            elif line.startswith("STATS "):
+                print("Scan of %s tracks: %s" % (size, line[6:]))
+                failed = True
+                continue
+            elif not line.startswith("RESULT "):
+                continue
+            result = json.loads(line[7:])
+            print("%8d %7s %9.2f %9.0f %10d %10d %8d %7d KiB" % tuple(
+                                        result[column] for column in columns))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -37,6 +37,7 @@ from lollypop.utils import is_gnome, is_unity
 from lollypop.define import ArtSize
 from lollypop.window import Window
 from lollypop.database import Database
+from lollypop.database_writer import DatabaseWriter
 from lollypop.player import Player
 from lollypop.art import Art
 from lollypop.sqlcursor import SqlCursor
@@ -50,6 +51,7 @@ from lollypop.database_tracks import TracksDatabase
 from lollypop.playlists import Playlists
 from lollypop.radios import Radios
 from lollypop.collectionscanner import CollectionScanner
+from lollypop.background import BackgroundPolicy
 from lollypop.fullscreen import FullScreen
 from lollypop.mpd import MpdServerDaemon
 
@@ -70,7 +72,6 @@ class Application(Gtk.Application):
                             self,
                             application_id='org.gnome.Lollypop',
                             flags=Gio.ApplicationFlags.HANDLES_COMMAND_LINE)
-        self.cursors = {}
         self.window = None
         self.notify = None
         self.mpd = None
@@ -122,12 +123,15 @@ class Application(Gtk.Application):
         # We store cursors for main thread
         SqlCursor.add(self.db)
         SqlCursor.add(self.playlists)
+        self.writer = DatabaseWriter(self.db)
         self.albums = AlbumsDatabase()
         self.artists = ArtistsDatabase()
         self.genres = GenresDatabase()
         self.tracks = TracksDatabase()
         self.player = Player()
-        self.scanner = CollectionScanner()
+        self.background = BackgroundPolicy()
+        self.scanner = CollectionScanner(
+                                    self.settings.get_value('auto-update'))
         self.art = Art()
         if not self.settings.get_value('disable-mpris'):
             MPRIS(self)
@@ -207,6 +211,7 @@ class Application(Gtk.Application):
             self.scanner.stop()
             GLib.idle_add(self.quit)
             return
+        self.writer.flush()
         try:
             with SqlCursor(self.db) as sql:
                 sql.execute('VACUUM')
@@ -303,7 +308,8 @@ class Application(Gtk.Application):
 
     def _update_db(self, action=None, param=None):
         """
-            Search for new music
+            Search for new music, user asked for it so
+            unchanged dirs are scanned too
             @param action as Gio.SimpleAction
             @param param as GLib.Variant
         """
@@ -311,7 +317,7 @@ class Application(Gtk.Application):
             t = Thread(target=self.art.clean_all_cache)
             t.daemon = True
             t.start()
-            self.window.update_db()
+            self.window.update_db(True)
 
     def _fullscreen(self, action=None, param=None):
         """
@@ -0,0 +1,170 @@
+# Copyright (c) 2014-2015 Cedric Bellegarde <cedric.bellegarde@adishatz.org>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gio, GLib, Gst
+
+from time import perf_counter
+import os
+
+from lollypop.settings import Settings
+from lollypop.database import Database
+from lollypop.database_writer import DatabaseWriter
+from lollypop.sqlcursor import SqlCursor
+from lollypop.database_albums import AlbumsDatabase
+from lollypop.database_artists import ArtistsDatabase
+from lollypop.database_genres import GenresDatabase
+from lollypop.database_tracks import TracksDatabase
+from lollypop.database_quarantine import QuarantineDatabase
+from lollypop.collectionscanner import CollectionScanner
+from lollypop.background import BackgroundPolicy
+
+
+class ScanApplication(Gio.Application):
+    """
+        Lollypop headless scanner:
+            - Update collection database without a display
+            - Print scan statistics
+    """
+
+    def __init__(self):
+        """
+            Create application
+        """
+        Gio.Application.__init__(
+                            self,
+                            application_id='org.gnome.Lollypop.Scanner',
+                            flags=Gio.ApplicationFlags.HANDLES_COMMAND_LINE |
+                            Gio.ApplicationFlags.NON_UNIQUE)
+        self.window = None
+        self.notify = None
+        self.player = None
+        self.debug = False
+        self._start = 0
+        self._status = 0
+        GLib.set_application_name('lollypop')
+        GLib.set_prgname('lollypop')
+        self.add_main_option("scan", 0, GLib.OptionFlags.NONE,
+                             GLib.OptionArg.NONE,
+                             "Update collection without user interface",
+                             None)
+        self.add_main_option("paths", 0, GLib.OptionFlags.NONE,
+                             GLib.OptionArg.FILENAME_ARRAY,
+                             "Music paths to scan instead of collection ones",
+                             "PATH")
+        self.add_main_option("full", 0, GLib.OptionFlags.NONE,
+                             GLib.OptionArg.NONE,
+                             "Rescan unchanged dirs and quarantined files",
+                             None)
+        self.add_main_option("debug", b'd', GLib.OptionFlags.NONE,
+                             GLib.OptionArg.NONE, "Debug lollypop", None)
+        self.connect('command-line', self._on_command_line)
+
+    def init(self):
+        """
+            Init databases and scanner
+        """
+        Gst.init(None)
+        self.settings = Settings.new()
+        self.db = Database()
+        # We store cursors for main thread
+        SqlCursor.add(self.db)
+        self.writer = DatabaseWriter(self.db)
+        self.albums = AlbumsDatabase()
+        self.artists = ArtistsDatabase()
+        self.genres = GenresDatabase()
+        self.tracks = TracksDatabase()
+        self.background = BackgroundPolicy()
+        self.scanner = CollectionScanner(False)
+
+    def run(self, argv):
+        """
+            Run scanner
+            @param argv as [str]
+            @return exit status as int, not 0 if scan failed
+        """
+        return Gio.Application.run(self, argv) or self._status
+
+#######################
+# PRIVATE             #
+#######################
+    def _on_command_line(self, app, app_cmd_line):
+        """
+            Handle command line
+            @param app as Gio.Application
+            @param options as Gio.ApplicationCommandLine
+        """
+        options = app_cmd_line.get_options_dict()
+        if options.contains('debug'):
+            self.debug = True
+        paths = None
+        if options.contains('paths'):
+            paths = [os.path.abspath(path) for path in
+                     options.lookup_value('paths').get_bytestring_array()]
+        self.init()
+        self.scanner.connect('scan-finished', self._on_scan_finished)
+        self._start = perf_counter()
+        self.scanner.update(None, paths, options.contains('full'))
+        # Nothing to scan
+        if not self.scanner.is_locked():
+            return 1
+        self.hold()
+        GLib.timeout_add_seconds(5, self._print_progress)
+        return 0
+
+    def _print_progress(self):
+        """
+            Print scan progress
+            @return True while scanning
+        """
+        if not self.scanner.is_locked():
+            return False
+        progress = self.scanner.scan_progress
+        eta = progress.get_eta()
+        if eta is not None:
+            print("%s/%s files, %d files/s, %d:%02d remaining" % (
+                                                        progress.current,
+                                                        progress.total,
+                                                        progress.get_rate(),
+                                                        eta // 60,
+                                                        eta % 60))
+        return True
+
+    def _on_scan_finished(self, scanner):
+        """
+            Print statistics and quit
+            @param scanner as CollectionScanner
+        """
+        try:
+            if scanner.failed:
+                self._status = 1
+                print("Collection update failed")
+                return
+            elapsed = perf_counter() - self._start
+            stats = scanner.stats
+            rate = 0
+            if elapsed > 0:
+                rate = stats.discovered / elapsed
+            print("Collection updated in %.1fs, %.1f files/s" % (elapsed,
+                                                                 rate))
+            print(stats)
+            for (path, error) in QuarantineDatabase().get_errors():
+                print("Quarantined: %s, %s" % (path, error))
+            self.writer.flush()
+            with SqlCursor(self.db) as sql:
+                sql.execute('VACUUM')
+        except Exception as e:
+            self._status = 1
+            print("ScanApplication::_on_scan_finished(): %s" % e)
+        finally:
+            self.release()
@@ -144,8 +144,20 @@ class AlbumArt(BaseArt, ArtDownloader, TagReader):
                                                                          size,
                                                                          size,
                                                                          False)
+                # Use embedded artwork saved by scanner
+                scanned = False
+                if pixbuf is None and album.id is not None:
+                    path = self.get_embedded_path(album.id)
+                    if os.path.exists(path):
+                        scanned = True
+                        if os.path.getsize(path) > 0:
+                            pixbuf = GdkPixbuf.Pixbuf.new_from_file_at_scale(
+                                                                     path,
+                                                                     size,
+                                                                     size,
+                                                                     False)
                 # Use tags artwork
-                if pixbuf is None and album.tracks:
+                if pixbuf is None and album.tracks and not scanned:
                     try:
                         pixbuf = self.pixbuf_from_tags(
                                     album.tracks[0].path, size)
@@ -88,8 +88,10 @@ class ArtDownloader:
             @thread safe
         """
         self._in_albums_download = True
+        Lp().background.set_low_priority()
         sql = Lp().db.get_cursor()
         while self._albums_queue:
+            Lp().background.wait()
             album_id = self._albums_queue.pop()
             album = Lp().albums.get_name(album_id)
             artist = Lp().albums.get_artist_name(album_id)
@@ -0,0 +1,163 @@
+# Copyright (c) 2014-2015 Cedric Bellegarde <cedric.bellegarde@adishatz.org>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from gi.repository import GLib
+
+import os
+import ctypes
+import platform
+try:
+    from threading import get_native_id
+except ImportError:  # Python < 3.8
+    get_native_id = None
+from time import time, sleep
+
+from lollypop.define import Lp
+from lollypop.utils import debug
+
+
+class BackgroundPolicy:
+    """
+        Keep background work (collection scan, art downloads) from
+        competing with playback and user interface:
+            - Workers get an idle I/O class and a lower nice level
+            - Workers pause while playback is buffering or main loop lags
+    """
+    # Nice level for background threads
+    _NICE = 10
+    # From linux/ioprio.h
+    _IOPRIO_WHO_PROCESS = 1
+    _IOPRIO_CLASS_IDLE = 3
+    _IOPRIO_CLASS_SHIFT = 13
+    _SYS_IOPRIO_SET = {'x86_64': 251, 'i386': 289, 'i686': 289,
+                       'aarch64': 30, 'armv7l': 314, 'ppc64le': 273}
+    _SYS_GETTID = {'x86_64': 186, 'i386': 224, 'i686': 224,
+                   'aarch64': 178, 'armv7l': 224, 'ppc64le': 207}
+    # Main loop probe interval in ms
+    _PROBE = 100
+    # Main loop is busy if probe is late by more than this (seconds)
+    _LAG = 0.05
+    # Stop probing after this time without a waiting worker (seconds)
+    _PROBE_TIMEOUT = 1.0
+    # Never pause a worker for longer, background work must progress
+    _MAX_WAIT = 5.0
+    _WAIT_STEP = 0.1
+
+    def __init__(self):
+        """
+            Init policy
+        """
+        self._buffering = False
+        self._lag = 0.0
+        self._probe_id = None
+        self._probe_time = 0.0
+        self._wait_time = 0.0
+        self._libc = None
+        try:
+            self._libc = ctypes.CDLL(None, use_errno=True)
+        except:
+            pass
+
+    def set_buffering(self, buffering):
+        """
+            Pause background work while playback is buffering
+            @param buffering as bool
+        """
+        self._buffering = buffering
+
+    def set_low_priority(self):
+        """
+            Lower priority of calling thread
+            @thread safe
+        """
+        if not self._is_enabled():
+            return
+        tid = self._get_thread_id()
+        if tid is None:
+            return
+        try:
+            # Linux nice level is per thread
+            if os.getpriority(os.PRIO_PROCESS, tid) < self._NICE:
+                os.setpriority(os.PRIO_PROCESS, tid, self._NICE)
+        except Exception as e:
+            debug("BackgroundPolicy::set_low_priority(): %s" % e)
+        syscall = self._SYS_IOPRIO_SET.get(platform.machine(), None)
+        if syscall is None or self._libc is None:
+            return
+        ioprio = self._IOPRIO_CLASS_IDLE << self._IOPRIO_CLASS_SHIFT
+        if self._libc.syscall(syscall, self._IOPRIO_WHO_PROCESS,
+                              tid, ioprio) != 0:
+            debug("BackgroundPolicy::set_low_priority(): ioprio_set: %s" %
+                  os.strerror(ctypes.get_errno()))
+
+    def wait(self):
+        """
+            Block calling worker while foreground is busy
+            @thread safe
+        """
+        if not self._is_enabled():
+            return
+        self._wait_time = time()
+        if self._probe_id is None and Lp().window is not None:
+            self._probe_time = time()
+            self._probe_id = GLib.timeout_add(self._PROBE, self._probe)
+        start = time()
+        while self._is_busy() and time() - start < self._MAX_WAIT:
+            sleep(self._WAIT_STEP)
+
+#######################
+# PRIVATE             #
+#######################
+    def _get_thread_id(self):
+        """
+            Get kernel id of calling thread
+            @return int or None if unavailable
+        """
+        if get_native_id is not None:
+            return get_native_id()
+        syscall = self._SYS_GETTID.get(platform.machine(), None)
+        if syscall is None or self._libc is None:
+            return None
+        tid = self._libc.syscall(syscall)
+        if tid <= 0:
+            return None
+        return tid
+
+    def _is_enabled(self):
+        """
+            True if background work should be throttled
+            @return bool
+        """
+        return Lp().settings.get_value('background-low-priority')
+
+    def _is_busy(self):
+        """
+            True if playback or user interface needs resources
+            @return bool
+        """
+        if self._buffering and Lp().player.is_playing():
+            return True
+        return self._lag > self._LAG
+
+    def _probe(self):
+        """
+            Measure main loop lag, a late timeout means user interface
+            is busy
+        """
+        now = time()
+        self._lag = now - self._probe_time - self._PROBE / 1000
+        self._probe_time = now
+        if now - self._wait_time > self._PROBE_TIMEOUT:
+            self._lag = 0.0
+            self._probe_id = None
+            return False
+        return True
@@ -15,13 +15,215 @@ from gi.repository import GLib, GObject, Gio
 import os
 from gettext import gettext as _
 from threading import Thread
-from time import time
+from time import time, perf_counter
 
 from lollypop.inotify import Inotify
-from lollypop.define import Lp
+from lollypop.database_dirs import DirsDatabase
+from lollypop.database_quarantine import QuarantineDatabase
+from lollypop.define import Lp, Type, FileType
 from lollypop.sqlcursor import SqlCursor
-from lollypop.tagreader import ScannerTagReader
-from lollypop.utils import is_audio, is_pls, debug
+from lollypop.tagreader import ScannerTagReader, TagReaderPool
+from lollypop.utils import get_file_type, get_file_type_by_extension, debug
+from lollypop.utils import is_rotational
+
+
+class ScannerBatch:
+    """
+        Rows waiting to be written by the collection scanner
+    """
+
+    def __init__(self):
+        """
+            Init batch
+        """
+        self.tracks = []
+        # Tracks get their ids when written, rows use their path
+        self.track_artists = []
+        self.track_genres = []
+        self.album_genres = set()
+        # Album id: artist id, for albums without album artist
+        self.no_album_artist = {}
+        self.new_genre_ids = []
+        # (artist id, album id)
+        self.new_artist_ids = []
+
+    def is_empty(self):
+        """
+            True if nothing to write
+            @return bool
+        """
+        return not self.tracks
+
+
+class ScanCheckpoint:
+    """
+        Track dirs fully scanned, saved as scan cursor so an interrupted
+        scan does not walk and discover them again
+    """
+
+    def __init__(self, dir_mtimes):
+        """
+            Init checkpoint
+            @param dir_mtimes as {dir path: mtime as int}
+        """
+        self._mtimes = dict(dir_mtimes)
+        # Dir path: files left to discover in dir and its subdirs
+        self._remaining = {}
+
+    def add(self, path):
+        """
+            Wait for path and its parents before saving them
+            @param path as str, a file to discover or a dir
+            with tracks to delete
+        """
+        path = os.path.dirname(path)
+        while path in self._mtimes:
+            self._remaining[path] = self._remaining.get(path, 0) + 1
+            path = os.path.dirname(path)
+
+    def done(self, filepath):
+        """
+            Mark file as done
+            @param filepath as str
+        """
+        path = os.path.dirname(filepath)
+        while path in self._mtimes:
+            self._remaining[path] -= 1
+            path = os.path.dirname(path)
+
+    def discard(self, filepath):
+        """
+            Never save dirs of file, it was not added to db
+            @param filepath as str
+        """
+        path = os.path.dirname(filepath)
+        while path in self._mtimes:
+            del self._mtimes[path]
+            path = os.path.dirname(path)
+
+    def pop_done(self):
+        """
+            Return dirs with nothing left to do, they are only returned once
+            @return {dir path: mtime as int}
+        """
+        done = {}
+        for (path, mtime) in self._mtimes.items():
+            if not self._remaining.get(path, 0):
+                done[path] = mtime
+        for path in done.keys():
+            del self._mtimes[path]
+        return done
+
+
+class ScanStats:
+    """
+        Collection scanner statistics
+    """
+
+    def __init__(self):
+        """
+            Init stats
+        """
+        # Files found while walking collection
+        self.classified = 0
+        # Files with an unknown extension, needing a content type sniff
+        self.sniffed = 0
+        # Time spent classifying files in seconds
+        self.classify_time = 0.0
+        # Files sent to tag readers
+        self.discovered = 0
+        # Quarantined files skipped
+        self.skipped = 0
+        # Files failing discovery in this scan
+        self.quarantined = 0
+
+    def merge(self, stats):
+        """
+            Add walk stats from another lane
+            @param stats as ScanStats
+        """
+        self.classified += stats.classified
+        self.sniffed += stats.sniffed
+        self.classify_time += stats.classify_time
+
+    def __str__(self):
+        """
+            Return stats as a human readable string
+        """
+        cost = 0
+        if self.classified:
+            cost = self.classify_time * 1000000 / self.classified
+        return "%s files classified (%s sniffed), %.1fus per file, "\
+               "%s files discovered, "\
+               "%s quarantined files skipped, %s files quarantined" % (
+                                                            self.classified,
+                                                            self.sniffed,
+                                                            cost,
+                                                            self.discovered,
+                                                            self.skipped,
+                                                            self.quarantined)
+
+
+class ScanProgress:
+    """
+        Scanner progress, main loop is notified at a fixed frequency
+        whatever the scanned files count is
+    """
+    # Max notifications per second
+    _FREQUENCY = 10
+
+    def __init__(self, callback):
+        """
+            Init progress
+            @param callback as function(current as int, total as int),
+            called in main loop
+        """
+        self._callback = callback
+        self._last = 0
+        self.reset(0, 0)
+
+    def reset(self, current, total):
+        """
+            Start counting files
+            @param current as int, already scanned files
+            @param total as int, files to scan
+        """
+        self.current = current
+        self.total = total
+        self._start = perf_counter()
+        self._start_count = current
+
+    def set(self, current):
+        """
+            Set scanned files count
+            @param current as int
+            @thread safe
+        """
+        self.current = current
+        now = perf_counter()
+        if now - self._last >= 1 / self._FREQUENCY:
+            self._last = now
+            GLib.idle_add(self._callback, current, self.total)
+
+    def get_rate(self):
+        """
+            Return scan rate since reset
+            @return files per second as float
+        """
+        elapsed = perf_counter() - self._start
+        if elapsed <= 0:
+            return 0.0
+        return (self.current - self._start_count) / elapsed
+
+    def get_eta(self):
+        """
+            Return estimated remaining time
+            @return seconds as int or None if unknown
+        """
+        rate = self.get_rate()
+        if rate <= 0:
+            return None
+        return int((self.total - self.current) / rate)
 
 
 class CollectionScanner(GObject.GObject, ScannerTagReader):
@@ -34,38 +236,74 @@ class CollectionScanner(GObject.GObject, ScannerTagReader):
         'genre-update': (GObject.SignalFlags.RUN_FIRST, None, (int,)),
         'album-modified': (GObject.SignalFlags.RUN_FIRST, None, (int,))
     }
+    # Tracks written to db per transaction
+    _BATCH_SIZE = 1000
 
-    def __init__(self):
+    def __init__(self, monitor):
         """
             Init collection scanner
+            @param monitor as bool, update collection on changes
         """
         GObject.GObject.__init__(self)
         ScannerTagReader.__init__(self)
 
         self._thread = None
+        # True if last scan failed
+        self.failed = False
+        self.stats = ScanStats()
+        self.scan_progress = ScanProgress(self._update_progress)
+        self._dirs = DirsDatabase()
+        self._quarantine = QuarantineDatabase()
+        self._quarantined = {}
+        self._checkpoint = None
+        self._is_empty = False
+        # Tag reader workers per device
+        self._lanes = {}
         self._inotify = None
-        if Lp().settings.get_value('auto-update'):
+        if monitor:
             self._inotify = Inotify()
         self._progress = None
 
-    def update(self, progress):
+    def update(self, progress, paths=None, force=False):
         """
             Update database
-            @param progress as Gtk.Scale
+            @param progress as Gtk.Scale or None
+            @param paths as [str], music paths, default to collection paths
+            @param force as bool, walk unchanged dirs and retry
+            quarantined files
         """
         if not self.is_locked():
-            progress.show()
+            if progress is not None:
+                progress.show()
             self._progress = progress
             # Keep track of on file with missing codecs
             self._missing_codecs = None
             self.init_discover()
-            paths = Lp().settings.get_music_paths()
+            # Only tracks in given paths may be deleted
+            partial = paths is not None
+            if paths is None:
+                paths = Lp().settings.get_music_paths()
             if not paths:
                 return
 
             if Lp().notify is not None:
                 Lp().notify.send(_("Your music is updating"))
-            self._thread = Thread(target=self._scan, args=(paths,))
+            self._thread = Thread(target=self._run,
+                                  args=(self._scan, paths,
+                                        force, partial))
+            self._thread.daemon = True
+            self._thread.start()
+
+    def update_files(self, created, deleted):
+        """
+            Update database for changed files
+            @param created as {str}, created/modified files and dirs
+            @param deleted as {str}, deleted files and dirs
+        """
+        if not self.is_locked():
+            self._missing_codecs = None
+            self._thread = Thread(target=self._run,
+                                  args=(self._scan_changes, created, deleted))
             self._thread.daemon = True
             self._thread.start()
 
@@ -83,49 +321,172 @@ class CollectionScanner(GObject.GObject, ScannerTagReader):
         if self._progress is not None:
             self._progress.hide()
             self._progress.set_fraction(0.0)
+            self._progress.set_tooltip_text(None)
             self._progress = None
 
 #######################
 # PRIVATE             #
 #######################
-    def _get_objects_for_paths(self, paths):
+    def _get_objects_for_paths(self, paths, force=False):
         """
             Return all tracks/dirs for paths
+            Files in dirs not modified since last scan are not listed
             @param paths as string
-            @return ([tracks path], [dirs path], track count)
+            @param force as bool, list files in all dirs
+            @return ([tracks path], [dirs path], track count,
+                     {unchanged dirs path}, {dir path: mtime as int})
         """
         tracks = []
-        track_dirs = list(paths)
+        track_dirs = []
+        unchanged_dirs = set()
+        dir_mtimes = {}
         count = 0
+        # Unchanged dirs content is known from last scan
+        if force:
+            known_mtimes = {}
+        else:
+            known_mtimes = self._dirs.get_mtimes()
+        known_subdirs = {}
+        for path in known_mtimes.keys():
+            parent = os.path.dirname(path)
+            if parent in known_subdirs:
+                known_subdirs[parent].append(path)
+            else:
+                known_subdirs[parent] = [path]
+
+        # Walk each device in its own lane
+        roots = {}
         for path in paths:
-            for root, dirs, files in os.walk(path):
-                # Add dirs
-                for d in dirs:
-                    track_dirs.append(os.path.join(root, d))
-                # Add files
-                for name in files:
-                    filepath = os.path.join(root, name)
-                    try:
-                        f = Gio.File.new_for_path(filepath)
-                        if is_pls(f):
-                            pass
-                        elif is_audio(f):
-                            tracks.append(filepath)
-                            count += 1
-                        else:
-                            debug("%s not detected as a music file" % filepath)
-                    except Exception as e:
-                        print("CollectionScanner::_get_objects_for_paths: %s"
-                              % e)
-        return (tracks, track_dirs, count)
+            try:
+                device = os.stat(path).st_dev
+            except Exception as e:
+                print("CollectionScanner::_get_objects_for_paths: %s" % e)
+                continue
+            if device in roots:
+                roots[device].append(path)
+            else:
+                roots[device] = [path]
+        lanes = [(device_paths, [], [], set(), {}, ScanStats())
+                 for device_paths in roots.values()]
+        if len(lanes) == 1:
+            self._walk(known_mtimes, known_subdirs, *lanes[0])
+        else:
+            threads = []
+            for lane in lanes:
+                thread = Thread(target=self._walk,
+                                args=(known_mtimes, known_subdirs) + lane)
+                thread.daemon = True
+                thread.start()
+                threads.append(thread)
+            for thread in threads:
+                thread.join()
+        for (device_paths, lane_tracks, lane_dirs,
+             lane_unchanged, lane_mtimes, stats) in lanes:
+            tracks += lane_tracks
+            track_dirs += lane_dirs
+            unchanged_dirs |= lane_unchanged
+            dir_mtimes.update(lane_mtimes)
+            count += len(lane_tracks)
+            self.stats.merge(stats)
+        return (tracks, track_dirs, count, unchanged_dirs, dir_mtimes)
+
+    def _walk(self, known_mtimes, known_subdirs, paths, tracks, track_dirs,
+              unchanged_dirs, dir_mtimes, stats):
+        """
+            Walk paths, filling tracks/dirs lists
+            @param known_mtimes as {dir path: mtime as int}
+            @param known_subdirs as {dir path: [subdir path]}
+            @param paths as [str]
+            @param tracks as [str]
+            @param track_dirs as [str]
+            @param unchanged_dirs as {str}
+            @param dir_mtimes as {dir path: mtime as int}
+            @param stats as ScanStats
+            @thread safe
+        """
+        to_walk = list(paths)
+        while to_walk:
+            Lp().background.wait()
+            root = to_walk.pop()
+            try:
+                # Nanoseconds, changes may happen in the second we list dir
+                mtime = os.stat(root).st_mtime_ns
+            except Exception as e:
+                print("CollectionScanner::_walk: %s" % e)
+                continue
+            track_dirs.append(root)
+            dir_mtimes[root] = mtime
+            if known_mtimes.get(root) == mtime:
+                unchanged_dirs.add(root)
+                to_walk += known_subdirs.get(root, [])
+                continue
+            try:
+                entries = sorted(os.scandir(root), key=lambda e: e.name)
+            except Exception as e:
+                print("CollectionScanner::_walk: %s" % e)
+                continue
+            for entry in entries:
+                try:
+                    # Like os.walk(), do not follow symlinks to dirs
+                    if entry.is_dir(follow_symlinks=False):
+                        to_walk.append(entry.path)
+                        continue
+                    elif entry.is_dir():
+                        continue
+                    start = perf_counter()
+                    file_type = get_file_type_by_extension(entry.name)
+                    if file_type is None:
+                        f = Gio.File.new_for_path(entry.path)
+                        file_type = get_file_type(f)
+                        stats.sniffed += 1
+                    stats.classified += 1
+                    stats.classify_time += perf_counter() - start
+                    if file_type == FileType.AUDIO:
+                        tracks.append(entry.path)
+                    elif file_type == FileType.NONE:
+                        debug("%s not detected as a music file" % entry.path)
+                except Exception as e:
+                    print("CollectionScanner::_walk: %s" % e)
+
+    def _get_lane(self, filepath, st):
+        """
+            Get tag reader lane for file
+            @param filepath as str
+            @param st as os.stat_result
+            @return (device as int, max workers as int, 0 for no limit)
+        """
+        device = st.st_dev
+        if device not in self._lanes:
+            workers = self._count_lane_workers(device)
+            self._lanes[device] = workers
+        return (device, self._lanes[device])
+
+    def _count_lane_workers(self, device):
+        """
+            Get max concurrent readers for device
+            Only spinning disks are limited, seeking kills throughput
+            @param device as int
+            @return int, 0 for no limit
+        """
+        if is_rotational(device):
+            return Lp().settings.get_value(
+                                    'scan-rotational-threads').get_int32()
+        return 0
 
     def _update_progress(self, current, total):
         """
             Update progress bar status
             @param scanned items as int, total items as int
         """
-        if self._progress is not None:
+        if self._progress is not None and total:
             self._progress.set_fraction(current/total)
+            eta = self.scan_progress.get_eta()
+            if eta is not None:
+                self._progress.set_tooltip_text(
+                               _("%d files/s, %d:%02d remaining") % (
+                                            self.scan_progress.get_rate(),
+                                            eta // 60,
+                                            eta % 60))
 
     def _finish(self):
         """
@@ -134,90 +495,391 @@ class CollectionScanner(GObject.GObject, ScannerTagReader):
         Lp().settings.set_value('db-mtime', GLib.Variant('i', int(time())))
         self.stop()
         self.emit("scan-finished")
-        if self._missing_codecs is not None:
+        if self._missing_codecs is not None and Lp().player is not None:
             Lp().player.load_external(
                                     GLib.filename_to_uri(self._missing_codecs))
             Lp().player.play_first_external()
 
-    def _scan(self, paths):
+    def _init_scan(self):
+        """
+            Reset scan state
+        """
+        self._new_albums = []
+        self._embedded = set()
+        # Embedded covers written since last commit
+        self._uncommitted_embedded = set()
+        self._checkpoint = None
+        # Files not added to db, their dirs must be walked again
+        self._not_added = set()
+        # Modified file path: old track id, deleted when file is written
+        self._replaced = {}
+        # Stats of albums losing replaced tracks, as before the scan:
+        # album id: (count, duration, popularity, mtime)
+        self._replaced_albums = {}
+        self._lanes = {}
+        self.init_caches()
+        self.stats = ScanStats()
+        self._batch = ScannerBatch()
+        self._quarantined = self._quarantine.get_mtimes()
+        if not os.path.exists(self._EMBEDDED_PATH):
+            os.makedirs(self._EMBEDDED_PATH)
+
+    def _run(self, scan, *args):
+        """
+            Run scan, finish it if it fails so scanner is not left locked
+            @param scan as function
+            @param args as scan args
+            @thread safe
+        """
+        self.failed = False
+        try:
+            scan(*args)
+        except Exception as e:
+            print("CollectionScanner::_run(): %s" % e)
+            with SqlCursor(Lp().db) as sql:
+                sql.rollback()
+            # Album ids are reused, covers must not outlive their album
+            for album_id in self._uncommitted_embedded:
+                try:
+                    os.remove(self.get_embedded_path(album_id))
+                except:
+                    pass
+            self.failed = True
+            GLib.idle_add(self._finish)
+
+    def _scan(self, paths, force=False, partial=False):
         """
             Scan music collection for music files
             @param paths as [string], paths to scan
+            @param force as bool, walk unchanged dirs and retry
+            quarantined files
+            @param partial as bool, paths are not the whole collection
             @thread safe
         """
-        self._new_albums = []
-        mtimes = Lp().tracks.get_mtimes()
-        orig_tracks = Lp().tracks.get_paths()
-        is_empty = len(orig_tracks) == 0
+        self._init_scan()
+        Lp().background.set_low_priority()
+        if force:
+            self._quarantined = {}
+        files = Lp().tracks.get_files()
+        orig_tracks = set(files.keys())
+        # Tracks outside of scanned paths are kept
+        if partial:
+            prefixes = tuple(os.path.join(path, '') for path in paths)
+            orig_tracks = {filepath for filepath in orig_tracks
+                           if filepath.startswith(prefixes)}
+            self._quarantined = {filepath: mtime for (filepath, mtime)
+                                 in self._quarantined.items()
+                                 if filepath.startswith(prefixes)}
+        self._is_empty = len(files) == 0
 
         # Add monitors on dirs
-        (new_tracks, new_dirs, count) = self._get_objects_for_paths(paths)
+        (new_tracks, new_dirs, count,
+         unchanged_dirs, dir_mtimes) = self._get_objects_for_paths(paths,
+                                                                   force)
         if self._inotify is not None:
-            for d in new_dirs:
-                self._inotify.add_monitor(d)
+            self._inotify.add_monitors(new_dirs)
+        # Tracks in unchanged dirs are still there
+        if unchanged_dirs:
+            orig_tracks = {filepath for filepath in orig_tracks
+                           if os.path.dirname(filepath) not in unchanged_dirs}
 
         with SqlCursor(Lp().db) as sql:
             i = 0
+            # Unchanged files are skipped, others are sent to discoverers
+            to_discover = []
+            # Unchanged files without identity, from older databases
+            identities = []
             for filepath in new_tracks:
                 if self._thread is None:
                     return
-                GLib.idle_add(self._update_progress, i, count)
                 try:
-                    mtime = int(os.path.getmtime(filepath))
-                    if filepath not in orig_tracks:
-                        try:
-                            debug("Adding file: %s" % filepath)
-                            infos = self.get_infos(filepath)
-                            self._add2db(filepath, mtime, infos)
-                        except Exception as e:
-                            debug("Error scanning: %s, %s" % (filepath, e))
-                            string = "%s" % e
-                            if string.startswith('gst-core-error-quark'):
-                                self._missing_codecs = filepath
+                    st = os.stat(filepath)
+                    if self._quarantined.get(filepath) == int(st.st_mtime):
+                        self.stats.skipped += 1
+                        self._not_added.add(filepath)
+                        i += 1
+                    elif filepath not in files or\
+                            int(st.st_mtime) != files[filepath][1]:
+                        to_discover.append((filepath, st))
                     else:
-                        # Update tags by removing song and readd it
-                        if mtime != mtimes[filepath]:
-                            debug("Adding file: %s" % filepath)
-                            infos = self.get_infos(filepath)
-                            if infos is not None:
-                                self._add2db(filepath, mtime, infos)
-                            else:
-                                print("Can't get infos for ", filepath)
-                        else:
-                            orig_tracks.remove(filepath)
-
+                        orig_tracks.discard(filepath)
+                        if files[filepath][3] is None:
+                            identities.append((st.st_dev, st.st_ino,
+                                               st.st_size, files[filepath][0]))
+                        i += 1
                 except Exception as e:
                     print(ascii(filepath))
                     print("CollectionScanner::_scan(): %s" % e)
-                i += 1
+                    self._not_added.add(filepath)
+                    i += 1
+            Lp().tracks.set_identities(identities)
 
-            # Restore stats for new albums
-            if not is_empty:
-                for album_id in self._new_albums:
-                    duration = Lp().albums.get_duration(album_id, None)
-                    count = Lp().albums.get_count(album_id, None)
-                    value = Lp().albums.get_stats(duration, count)
-                    if value is not None:
-                        Lp().albums.set_popularity(album_id, value[0])
-                        Lp().albums.set_mtime(album_id, value[1])
-
-            # Clean deleted files
+            # Moved files do not need to be discovered again
+            seen = set(new_tracks)
+            vanished = {}
+            for filepath in orig_tracks - seen:
+                (track_id, mtime, device, inode, size) = files[filepath]
+                if inode is not None:
+                    vanished[(device, inode, size, mtime)] = filepath
+            moved = {}
+            if vanished:
+                new_files = []
+                for (filepath, st) in to_discover:
+                    identity = (st.st_dev, st.st_ino,
+                                st.st_size, int(st.st_mtime))
+                    if filepath not in files and identity in vanished:
+                        old_filepath = vanished.pop(identity)
+                        moved[old_filepath] = filepath
+                    else:
+                        new_files.append((filepath, st))
+                to_discover = new_files
+                self._move_files([(files[old_filepath][0], filepath)
+                                  for (old_filepath, filepath)
+                                  in moved.items()])
+                orig_tracks -= set(moved.keys())
+                i += len(moved)
+
+            # Modified files replace their old track in the same batch
+            for (filepath, st) in to_discover:
+                if filepath in files:
+                    self._replaced[filepath] = files[filepath][0]
+            orig_tracks -= set(self._replaced.keys())
+
+            # Dirs are saved at each batch, once all their files are added.
+            # Dirs with tracks to delete are only saved at the end
+            self._checkpoint = ScanCheckpoint(dir_mtimes)
+            for (filepath, st) in to_discover:
+                self._checkpoint.add(filepath)
             for filepath in orig_tracks:
-                track_id = Lp().tracks.get_id_by_path(filepath)
-                self._del_from_db(track_id)
+                self._checkpoint.add(filepath)
+            for filepath in self._not_added:
+                self._checkpoint.discard(filepath)
+            if not self._add_files(sql, to_discover, i, count):
+                return
+            self._checkpoint = None
+
+            # Restore stats for new albums
+            if not self._is_empty:
+                self._restore_albums_stats(self._new_albums)
+
+            # Clean deleted files and modified files not added again
+            self._del_from_db([files[filepath][0]
+                               for filepath in orig_tracks] +
+                              list(self._replaced.values()))
+            # Forget quarantined files not found anymore
+            for filepath in self._quarantined.keys():
+                if filepath not in seen and\
+                        os.path.dirname(filepath) not in unchanged_dirs:
+                    self._quarantine.remove(filepath)
+
+            # Dirs with files not added are walked again by next scan
+            for filepath in self._not_added:
+                path = os.path.dirname(filepath)
+                while path in dir_mtimes:
+                    del dir_mtimes[path]
+                    path = os.path.dirname(path)
+            if partial:
+                self._dirs.set_mtimes(dir_mtimes, paths)
+            else:
+                self._dirs.set_mtimes(dir_mtimes)
+            sql.commit()
+        debug("CollectionScanner::_scan(): %s" % self.stats)
+        GLib.idle_add(self._finish)
+
+    def _scan_changes(self, created, deleted):
+        """
+            Update collection for changed paths only
+            @param created as {str}, created/modified files and dirs
+            @param deleted as {str}, deleted files and dirs
+            @thread safe
+        """
+        self._init_scan()
+        Lp().background.set_low_priority()
+        self._is_empty = Lp().tracks.is_empty()
+
+        # Walk new dirs, they may come with files (moved from elsewhere)
+        new_tracks = []
+        new_dirs = []
+        for path in created:
+            if os.path.isdir(path):
+                new_dirs.append(path)
+            elif os.path.exists(path):
+                file_type = get_file_type_by_extension(path)
+                if file_type is None:
+                    file_type = get_file_type(Gio.File.new_for_path(path))
+                if file_type == FileType.AUDIO:
+                    new_tracks.append(path)
+        if new_dirs:
+            (tracks, track_dirs, count,
+             unchanged_dirs, dir_mtimes) = self._get_objects_for_paths(
+                                                                    new_dirs)
+            new_tracks += tracks
+            if self._inotify is not None:
+                self._inotify.add_monitors(track_dirs)
+
+        with SqlCursor(Lp().db) as sql:
+            to_discover = []
+            old_track_ids = []
+            moved = []
+            for filepath in new_tracks:
+                try:
+                    st = os.stat(filepath)
+                    track_id = Lp().tracks.get_id_by_path(filepath)
+                    if self._quarantined.get(filepath) == int(st.st_mtime):
+                        self.stats.skipped += 1
+                    elif track_id is None:
+                        # Moved from a path we know?
+                        track_id = Lp().tracks.get_id_by_identity(
+                                                        st.st_dev,
+                                                        st.st_ino,
+                                                        st.st_size,
+                                                        int(st.st_mtime))
+                        if track_id is not None and not os.path.exists(
+                                        Lp().tracks.get_path(track_id)):
+                            moved.append((track_id, filepath))
+                        else:
+                            to_discover.append((filepath, st))
+                    elif Lp().tracks.get_mtime(track_id) != int(st.st_mtime):
+                        to_discover.append((filepath, st))
+                        # Modified tracks are readded and old entries
+                        # deleted in the same batch
+                        self._replaced[filepath] = track_id
+                except Exception as e:
+                    print("CollectionScanner::_scan_changes(): %s" % e)
+            self._move_files(moved)
 
+            if not self._add_files(sql, to_discover, 0, len(to_discover)):
+                return
+            if not self._is_empty:
+                self._restore_albums_stats(self._new_albums)
+
+            for path in deleted:
+                # Deleted then created again, already handled
+                if os.path.exists(path):
+                    continue
+                if path in self._quarantined:
+                    self._quarantine.remove(path)
+                track_id = Lp().tracks.get_id_by_path(path)
+                if track_id is None:
+                    old_track_ids += Lp().tracks.get_ids_in_dir(path)
+                else:
+                    old_track_ids.append(track_id)
+            self._del_from_db(old_track_ids + list(self._replaced.values()))
             sql.commit()
+        debug("CollectionScanner::_scan_changes(): %s" % self.stats)
         GLib.idle_add(self._finish)
 
-    def _add2db(self, filepath, mtime, infos):
+    def _add_files(self, sql, files, current, total):
+        """
+            Discover files and add them to db
+            @param sql as sqlite cursor
+            @param files as [(filepath as str, stat as os.stat_result)]
+            @param current as int, already scanned files
+            @param total as int, files to scan
+            @return False if scan stopped
+        """
+        self.scan_progress.reset(current, total)
+        pool = TagReaderPool(
+                          Lp().settings.get_value('scan-threads').get_int32(),
+                          Lp().settings.get_value('header-tag-reader'))
+        for (filepath, st, infos, error) in pool.discover(files,
+                                                          self._get_lane):
+            if self._thread is None:
+                # Keep what is already discovered for next scan
+                self._flush_batch(sql)
+                return False
+            self.scan_progress.set(current)
+            self.stats.discovered += 1
+            try:
+                if error is not None:
+                    raise error
+                debug("Adding file: %s" % filepath)
+                if infos is not None:
+                    self._add2db(filepath, st, infos)
+                    if filepath in self._quarantined:
+                        self._quarantine.remove(filepath)
+                else:
+                    print("Can't get infos for ", filepath)
+                    self._add_to_quarantine(filepath, st, "No informations")
+            except Exception as e:
+                debug("Error scanning: %s, %s" % (filepath, e))
+                string = "%s" % e
+                # Not quarantined, codecs may be installed later
+                if string.startswith('gst-core-error-quark'):
+                    self._missing_codecs = filepath
+                    self._not_added.add(filepath)
+                else:
+                    self._add_to_quarantine(filepath, st, string)
+            current += 1
+            if self._checkpoint is not None:
+                if filepath in self._not_added:
+                    self._checkpoint.discard(filepath)
+                self._checkpoint.done(filepath)
+            if len(self._batch.tracks) >= self._BATCH_SIZE:
+                self._flush_batch(sql)
+        self._flush_batch(sql)
+        return True
+
+    def _add_to_quarantine(self, filepath, st, error):
+        """
+            Skip file in next scans until it changes
+            @param filepath as str
+            @param st as os.stat_result
+            @param error as str
+            @commit needed
+        """
+        print("CollectionScanner::_add_to_quarantine(): %s, %s" % (
+                                                            filepath, error))
+        self._quarantine.add(filepath, int(st.st_mtime), error)
+        self._not_added.add(filepath)
+        self.stats.quarantined += 1
+
+    def _move_files(self, moved):
+        """
+            Update path for moved tracks
+            @param moved as [(track id as int, new filepath as str)]
+            @commit needed
+        """
+        album_paths = {}
+        for (track_id, filepath) in moved:
+            debug("Moving file: %s" % filepath)
+            album_id = Lp().tracks.get_album_id(track_id)
+            album_paths[album_id] = os.path.dirname(filepath)
+        Lp().tracks.set_paths(moved)
+        for (album_id, path) in album_paths.items():
+            Lp().albums.set_path(album_id, path)
+            self._album_paths[album_id] = path
+
+    def _restore_albums_stats(self, album_ids):
+        """
+            Restore stats for new albums
+            @param album_ids as [int]
+            @commit needed
+        """
+        # Albums emptied by replaced tracks are gone from db
+        replaced = {}
+        for album_id in sorted(self._replaced_albums.keys(), reverse=True):
+            (count, duration,
+             popularity, mtime) = self._replaced_albums[album_id]
+            replaced[(count, duration)] = (popularity, mtime)
+        for album_id in album_ids:
+            value = Lp().albums.get_stats(album_id)
+            if value is None and replaced:
+                value = replaced.get(Lp().albums.get_fingerprint(album_id))
+            if value is not None:
+                Lp().albums.set_popularity(album_id, value[0])
+                Lp().albums.set_mtime(album_id, value[1])
+
+    def _add2db(self, filepath, st, infos):
         """
-            Add new file to db with informations
+            Add new file to current batch with informations
             @param filepath as string
-            @param file modification time as int
+            @param st as os.stat_result
             @param infos as GstPbutils.DiscovererInfo
-            @return track id as int
+            @commit needed, see _flush_batch()
         """
         tags = infos.get_tags()
+        mtime = int(st.st_mtime)
 
         title = self.get_title(tags, filepath)
         artists = self.get_artists(tags)
@@ -246,8 +908,10 @@ class CollectionScanner(GObject.GObject, ScannerTagReader):
                                          mtime)
         if new:
             self._new_albums.append(album_id)
+        if album_id not in self._embedded:
+            self._save_embedded(album_id, tags, new)
 
-        (genre_ids, new_genre_ids) = self.add_genres(genres, album_id)
+        (genre_ids, new_genre_ids) = self.add_genres(genres)
 
         # Restore stats
         value = Lp().tracks.get_stats(filepath, duration)
@@ -257,37 +921,140 @@ class CollectionScanner(GObject.GObject, ScannerTagReader):
         else:
             popularity = value[0]
             ltime = value[1]
-        # Add track to db
-        track_id = Lp().tracks.add(title, filepath, duration,
-                                   tracknumber, discnumber,
-                                   album_id, year, popularity, ltime, mtime)
-        self.update_track(track_id, artist_ids, genre_ids)
-
-        # Notify about new artists/genres
-        if new_genre_ids or new_artist_ids:
-            with SqlCursor(Lp().db) as sql:
-                sql.commit()
-            for genre_id in new_genre_ids:
-                GLib.idle_add(self.emit, 'genre-update', genre_id)
-            for artist_id in new_artist_ids:
-                GLib.idle_add(self.emit, 'artist-update', artist_id, album_id)
-        return track_id
-
-    def _del_from_db(self, track_id):
-        """
-            Delete track from db
-            @param track_id as int
-        """
-        album_id = Lp().tracks.get_album_id(track_id)
-        genre_ids = Lp().tracks.get_genre_ids(track_id)
-        album_artist_id = Lp().albums.get_artist_id(album_id)
-        artist_ids = Lp().tracks.get_artist_ids(track_id)
-        Lp().tracks.remove(track_id)
-        Lp().tracks.clean(track_id)
-        modified = Lp().albums.clean(album_id)
-        if modified:
+
+        # Queue track, SQLite gives its id when batch is written
+        self._batch.tracks.append((title, filepath, duration,
+                                   tracknumber, discnumber, album_id, year,
+                                   popularity, ltime, mtime,
+                                   os.path.basename(filepath), st.st_dev,
+                                   st.st_ino, st.st_size))
+        for artist_id in set(artist_ids):
+            self._batch.track_artists.append((filepath, artist_id))
+        for genre_id in set(genre_ids):
+            self._batch.track_genres.append((filepath, genre_id))
+            self._batch.album_genres.add((album_id, genre_id))
+        if no_album_artist:
+            self._batch.no_album_artist[album_id] = album_artist_id
+            if album_id in self._compilation_artist_ids:
+                self._compilation_artist_ids[album_id].update(artist_ids)
+            else:
+                self._compilation_artist_ids[album_id] = set(artist_ids)
+        self._batch.new_genre_ids += new_genre_ids
+        for artist_id in new_artist_ids:
+            self._batch.new_artist_ids.append((artist_id, album_id))
+
+    def _save_embedded(self, album_id, tags, new):
+        """
+            Save embedded cover for album, so album artwork does not
+            need to discover tracks again.
+            An empty file means no track of album has a cover, only known
+            for albums created by this scan: all their tracks are scanned
+            @param album_id as int
+            @param tags as Gst.TagList
+            @param new as bool, album just created
+        """
+        path = self.get_embedded_path(album_id)
+        try:
+            image = self.get_image(tags)
+            if image is not None:
+                with open(path, "wb") as f:
+                    f.write(image)
+                self._embedded.add(album_id)
+                self._uncommitted_embedded.add(album_id)
+            elif new:
+                open(path, "wb").close()
+                self._uncommitted_embedded.add(album_id)
+        except Exception as e:
+            print("CollectionScanner::_save_embedded(): %s" % e)
+
+    def _flush_batch(self, sql):
+        """
+            Write pending tracks to db in one transaction
+            and notify about new artists/genres
+            @param sql as sqlite cursor
+        """
+        batch = self._batch
+        self._batch = ScannerBatch()
+        if not batch.is_empty():
+            track_ids = Lp().tracks.add_all(batch.tracks)
+            Lp().tracks.add_artists([(track_ids[filepath], artist_id)
+                                     for (filepath, artist_id)
+                                     in batch.track_artists])
+            Lp().tracks.add_genres([(track_ids[filepath], genre_id)
+                                    for (filepath, genre_id)
+                                    in batch.track_genres])
+            Lp().albums.add_genres(list(batch.album_genres))
+            fingerprints = {}
+            for track in batch.tracks:
+                (count, duration) = fingerprints.get(track[5], (0, 0))
+                fingerprints[track[5]] = (count + 1, duration + track[2])
+            Lp().albums.update_fingerprints([(album_id, count, duration)
+                                             for (album_id, (count, duration))
+                                             in fingerprints.items()])
+            # If no album artist, handle album artist id for compilations
+            for (album_id, artist_id) in batch.no_album_artist.items():
+                if len(self._compilation_artist_ids[album_id]) > 1:
+                    Lp().albums.set_artist_id(album_id, Type.COMPILATIONS)
+                else:
+                    Lp().albums.set_artist_id(album_id, artist_id)
+            # Delete old tracks of modified files now their new tracks
+            # exist, an interrupted scan can not keep both.
+            # Their albums may be deleted before new albums are complete,
+            # keep their stats
+            replaced = [self._replaced.pop(track[1])
+                        for track in batch.tracks
+                        if track[1] in self._replaced]
+            if replaced and not self._is_empty:
+                stats = Lp().albums.get_tracks_stats(replaced)
+                for (album_id, value) in stats.items():
+                    self._replaced_albums.setdefault(album_id, value)
+            self._del_from_db(replaced)
+        if self._checkpoint is not None:
+            self._save_checkpoint()
+        sql.commit()
+        self._uncommitted_embedded = set()
+        for genre_id in batch.new_genre_ids:
+            GLib.idle_add(self.emit, 'genre-update', genre_id)
+        for (artist_id, album_id) in batch.new_artist_ids:
+            GLib.idle_add(self.emit, 'artist-update', artist_id, album_id)
+
+    def _save_checkpoint(self):
+        """
+            Save dirs done since last checkpoint,
+            restore stats for their new albums
+            @commit needed
+        """
+        mtimes = self._checkpoint.pop_done()
+        if not mtimes:
+            return
+        album_ids = [album_id for album_id in self._new_albums
+                     if self._album_paths.get(album_id) in mtimes]
+        if not self._is_empty:
+            self._restore_albums_stats(album_ids)
+        self._new_albums = [album_id for album_id in self._new_albums
+                            if album_id not in album_ids]
+        self._dirs.add_mtimes(mtimes)
+
+    def _del_from_db(self, track_ids):
+        """
+            Delete tracks from db, with albums, artists and genres
+            not used anymore
+            @param track_ids as [int]
+            @commit needed
+        """
+        if not track_ids:
+            return
+        (fingerprints, artist_ids, genre_ids) = Lp().tracks.remove(track_ids)
+        Lp().albums.update_fingerprints(fingerprints)
+        (modified, deleted) = Lp().albums.clean([fingerprint[0]
+                                                 for fingerprint
+                                                 in fingerprints])
+        for album_id in modified:
             GLib.idle_add(self.emit, 'album-modified', album_id)
-        for artist_id in [album_artist_id] + artist_ids:
-            Lp().artists.clean(artist_id)
-        for genre_id in genre_ids:
-            Lp().genres.clean(genre_id)
+        Lp().artists.clean(artist_ids)
+        Lp().genres.clean(genre_ids)
+        for album_id in deleted:
+            try:
+                os.remove(self.get_embedded_path(album_id))
+            except:
+                pass
@@ -105,20 +105,21 @@ class Container:
         Lp().playlists.connect('playlists-changed',
                                self._update_playlists)
 
-    def update_db(self):
+    def update_db(self, force=False):
         """
             Update db at startup only if needed
+            @param force as bool, rescan unchanged dirs
         """
         # Stop previous scan
         if Lp().scanner.is_locked():
             Lp().scanner.stop()
-            GLib.timeout_add(250, self.update_db)
+            GLib.timeout_add(250, self.update_db, force)
         else:
             # Something (device manager) is using progress bar
             progress = None
             if not self._progress.is_visible():
                 progress = self._progress
-            Lp().scanner.update(progress)
+            Lp().scanner.update(progress, force=force)
 
     def get_genre_id(self):
         """
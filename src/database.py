@@ -25,6 +25,10 @@ class Database:
     """
     LOCAL_PATH = os.path.expanduser("~") + "/.local/share/lollypop"
     DB_PATH = "%s/lollypop.db" % LOCAL_PATH
+    # Page cache by connection in KiB
+    _CACHE_SIZE = 16384
+    # Memory mapped I/O in bytes
+    _MMAP_SIZE = 256 << 20
 
     # SQLite documentation:
     # In SQLite, a column with type INTEGER PRIMARY KEY
@@ -56,13 +60,136 @@ class Database:
                         year INT,
                         popularity INT NOT NULL,
                         ltime INT,
-                        mtime INT)'''
+                        mtime INT,
+                        basename TEXT,
+                        device INT,
+                        inode INT,
+                        size INT)'''
     create_track_artists = '''CREATE TABLE track_artists (
                                                 track_id INT NOT NULL,
                                                 artist_id INT NOT NULL)'''
     create_track_genres = '''CREATE TABLE track_genres (
                                                 track_id INT NOT NULL,
                                                 genre_id INT NOT NULL)'''
+    create_tracks_basename_idx = '''CREATE INDEX idx_tracks_basename
+                                    ON tracks(basename, duration)'''
+    # File identity, to find a track after a move
+    create_tracks_inode_idx = '''CREATE INDEX idx_tracks_inode
+                                 ON tracks(inode)'''
+    create_dirs = '''CREATE TABLE dirs (path TEXT PRIMARY KEY,
+                                        mtime INT NOT NULL)'''
+    create_quarantine = '''CREATE TABLE quarantine (path TEXT PRIMARY KEY,
+                                                  mtime INT NOT NULL,
+                                                  error TEXT)'''
+    # Track count and duration, to find an album after a retag
+    create_album_fingerprints = '''CREATE TABLE album_fingerprints (
+                                        album_id INTEGER PRIMARY KEY,
+                                        count INT NOT NULL,
+                                        duration INT NOT NULL)'''
+    create_album_fingerprints_idx = '''CREATE INDEX idx_album_fingerprints
+                                    ON album_fingerprints(count, duration)'''
+    # Lookups by path, album, artist, genre and name
+    create_tracks_filepath_idx = '''CREATE INDEX idx_tracks_filepath
+                                    ON tracks(filepath)'''
+    create_tracks_album_idx = '''CREATE INDEX idx_tracks_album
+                                    ON tracks(album_id, discnumber,
+                                              tracknumber)'''
+    create_track_artists_idx = '''CREATE INDEX idx_track_artists
+                                    ON track_artists(track_id, artist_id)'''
+    create_track_artists_artist_idx = '''CREATE INDEX idx_track_artists_artist
+                                    ON track_artists(artist_id, track_id)'''
+    create_track_genres_idx = '''CREATE INDEX idx_track_genres
+                                    ON track_genres(track_id, genre_id)'''
+    create_track_genres_genre_idx = '''CREATE INDEX idx_track_genres_genre
+                                    ON track_genres(genre_id, track_id)'''
+    create_album_genres_idx = '''CREATE INDEX idx_album_genres
+                                    ON album_genres(album_id, genre_id)'''
+    create_album_genres_genre_idx = '''CREATE INDEX idx_album_genres_genre
+                                    ON album_genres(genre_id, album_id)'''
+    create_albums_name_idx = '''CREATE INDEX idx_albums_name
+                                    ON albums(name, artist_id, year)'''
+    create_albums_artist_idx = '''CREATE INDEX idx_albums_artist
+                                    ON albums(artist_id, year)'''
+    create_artists_name_idx = '''CREATE INDEX idx_artists_name
+                                    ON artists(name)'''
+    create_genres_name_idx = '''CREATE INDEX idx_genres_name
+                                    ON genres(name)'''
+    # Full text search on names, kept in sync by triggers
+    create_search_artists = '''CREATE VIRTUAL TABLE
+                                    IF NOT EXISTS search_artists
+                                    USING fts5(name, content='artists',
+                                    tokenize='unicode61 remove_diacritics 2',
+                                    prefix='2 3')'''
+    create_search_artists_insert = '''CREATE TRIGGER
+                                    IF NOT EXISTS search_artists_insert
+                                    AFTER INSERT ON artists BEGIN
+                                    INSERT INTO search_artists(rowid, name)
+                                    VALUES (new.rowid, new.name); END'''
+    create_search_artists_delete = '''CREATE TRIGGER
+                                    IF NOT EXISTS search_artists_delete
+                                    AFTER DELETE ON artists BEGIN
+                                    INSERT INTO search_artists(search_artists,
+                                                            rowid, name)
+                                    VALUES ('delete', old.rowid, old.name);
+                                    END'''
+    create_search_artists_update = '''CREATE TRIGGER
+                                    IF NOT EXISTS search_artists_update
+                                    AFTER UPDATE OF name ON artists BEGIN
+                                    INSERT INTO search_artists(search_artists,
+                                                            rowid, name)
+                                    VALUES ('delete', old.rowid, old.name);
+                                    INSERT INTO search_artists(rowid, name)
+                                    VALUES (new.rowid, new.name); END'''
+    create_search_albums = '''CREATE VIRTUAL TABLE
+                                    IF NOT EXISTS search_albums
+                                    USING fts5(name, content='albums',
+                                    tokenize='unicode61 remove_diacritics 2',
+                                    prefix='2 3')'''
+    create_search_albums_insert = '''CREATE TRIGGER
+                                    IF NOT EXISTS search_albums_insert
+                                    AFTER INSERT ON albums BEGIN
+                                    INSERT INTO search_albums(rowid, name)
+                                    VALUES (new.rowid, new.name); END'''
+    create_search_albums_delete = '''CREATE TRIGGER
+                                    IF NOT EXISTS search_albums_delete
+                                    AFTER DELETE ON albums BEGIN
+                                    INSERT INTO search_albums(search_albums,
+                                                            rowid, name)
+                                    VALUES ('delete', old.rowid, old.name);
+                                    END'''
+    create_search_albums_update = '''CREATE TRIGGER
+                                    IF NOT EXISTS search_albums_update
+                                    AFTER UPDATE OF name ON albums BEGIN
+                                    INSERT INTO search_albums(search_albums,
+                                                            rowid, name)
+                                    VALUES ('delete', old.rowid, old.name);
+                                    INSERT INTO search_albums(rowid, name)
+                                    VALUES (new.rowid, new.name); END'''
+    create_search_tracks = '''CREATE VIRTUAL TABLE
+                                    IF NOT EXISTS search_tracks
+                                    USING fts5(name, content='tracks',
+                                    tokenize='unicode61 remove_diacritics 2',
+                                    prefix='2 3')'''
+    create_search_tracks_insert = '''CREATE TRIGGER
+                                    IF NOT EXISTS search_tracks_insert
+                                    AFTER INSERT ON tracks BEGIN
+                                    INSERT INTO search_tracks(rowid, name)
+                                    VALUES (new.rowid, new.name); END'''
+    create_search_tracks_delete = '''CREATE TRIGGER
+                                    IF NOT EXISTS search_tracks_delete
+                                    AFTER DELETE ON tracks BEGIN
+                                    INSERT INTO search_tracks(search_tracks,
+                                                            rowid, name)
+                                    VALUES ('delete', old.rowid, old.name);
+                                    END'''
+    create_search_tracks_update = '''CREATE TRIGGER
+                                    IF NOT EXISTS search_tracks_update
+                                    AFTER UPDATE OF name ON tracks BEGIN
+                                    INSERT INTO search_tracks(search_tracks,
+                                                            rowid, name)
+                                    VALUES ('delete', old.rowid, old.name);
+                                    INSERT INTO search_tracks(rowid, name)
+                                    VALUES (new.rowid, new.name); END'''
 
     def __init__(self):
         """
@@ -86,17 +213,89 @@ class Database:
                     sql.execute(self.create_genres)
                     sql.execute(self.create_album_genres)
                     sql.execute(self.create_tracks)
+                    sql.execute(self.create_tracks_basename_idx)
+                    sql.execute(self.create_tracks_inode_idx)
                     sql.execute(self.create_track_artists)
                     sql.execute(self.create_track_genres)
+                    sql.execute(self.create_dirs)
+                    sql.execute(self.create_quarantine)
+                    sql.execute(self.create_album_fingerprints)
+                    sql.execute(self.create_album_fingerprints_idx)
+                    sql.execute(self.create_tracks_filepath_idx)
+                    sql.execute(self.create_tracks_album_idx)
+                    sql.execute(self.create_track_artists_idx)
+                    sql.execute(self.create_track_artists_artist_idx)
+                    sql.execute(self.create_track_genres_idx)
+                    sql.execute(self.create_track_genres_genre_idx)
+                    sql.execute(self.create_album_genres_idx)
+                    sql.execute(self.create_album_genres_genre_idx)
+                    sql.execute(self.create_albums_name_idx)
+                    sql.execute(self.create_albums_artist_idx)
+                    sql.execute(self.create_artists_name_idx)
+                    sql.execute(self.create_genres_name_idx)
                     sql.commit()
+                # Search works without full text search, needs FTS5
+                try:
+                    with SqlCursor(self) as sql:
+                        self.create_search(sql)
+                        sql.commit()
+                except Exception as e:
+                    print("Database::__init__(): %s" % e)
+                # Fresh schema is up to date
+                upgrade = DatabaseUpgrade(0, self)
+                Lp().settings.set_value('db-version',
+                                        GLib.Variant('i', upgrade.count()))
             except:
                 print("Database::__init__(): %s" % self.LOCAL_PATH)
+        # Readers do not wait for scanner writes, journal mode is persistent
+        with SqlCursor(self) as sql:
+            sql.execute("PRAGMA journal_mode=WAL")
+
+    def create_search(self, sql):
+        """
+            Create full text search tables and fill them from names,
+            triggers keeping them in sync are only created with tables
+            @param sql as sqlite cursor
+            @return True if created, False without FTS5
+            @warning: commit needed
+        """
+        try:
+            sql.execute(self.create_search_artists)
+            sql.execute(self.create_search_albums)
+            sql.execute(self.create_search_tracks)
+        except sqlite3.OperationalError as e:
+            print("Database::create_search(): %s" % e)
+            return False
+        sql.execute(self.create_search_artists_insert)
+        sql.execute(self.create_search_artists_delete)
+        sql.execute(self.create_search_artists_update)
+        sql.execute(self.create_search_albums_insert)
+        sql.execute(self.create_search_albums_delete)
+        sql.execute(self.create_search_albums_update)
+        sql.execute(self.create_search_tracks_insert)
+        sql.execute(self.create_search_tracks_delete)
+        sql.execute(self.create_search_tracks_update)
+        sql.execute("INSERT INTO search_artists(search_artists)\
+                     VALUES ('rebuild')")
+        sql.execute("INSERT INTO search_albums(search_albums)\
+                     VALUES ('rebuild')")
+        sql.execute("INSERT INTO search_tracks(search_tracks)\
+                     VALUES ('rebuild')")
+        return True
 
     def get_cursor(self):
         """
             Return a new sqlite cursor
+            Cursor may be used by another thread once back in pool
         """
         try:
-            return sqlite3.connect(self.DB_PATH, 600.0)
+            sql = sqlite3.connect(self.DB_PATH, 600.0,
+                                  check_same_thread=False)
+            # WAL is safe with NORMAL, only last commits may be lost
+            # on power failure
+            sql.execute("PRAGMA synchronous=NORMAL")
+            sql.execute("PRAGMA cache_size=-%s" % self._CACHE_SIZE)
+            sql.execute("PRAGMA mmap_size=%s" % self._MMAP_SIZE)
+            return sql
         except:
             exit(-1)
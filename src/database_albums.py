@@ -23,6 +23,8 @@ class AlbumsDatabase:
     """
         Albums database helper
     """
+    # Ids per query, below SQLite host parameters limit
+    _ROWS_CHUNK = 500
 
     def __init__(self):
         """
@@ -66,6 +68,19 @@ class AlbumsDatabase:
                             "album_genres (album_id, genre_id)"
                             "VALUES (?, ?)", (album_id, genre_id))
 
+    def add_genres(self, album_genres):
+        """
+            Add genres to albums, existing ones are ignored
+            @param album_genres as [(album id as int, genre id as int)]
+            @warning: commit needed
+        """
+        with SqlCursor(Lp().db) as sql:
+            sql.executemany("INSERT INTO album_genres (album_id, genre_id)\
+                             SELECT ?1, ?2 WHERE NOT EXISTS\
+                                (SELECT 1 FROM album_genres\
+                                 WHERE album_id=?1 AND genre_id=?2)",
+                            album_genres)
+
     def set_artist_id(self, album_id, artist_id):
         """
             Set artist id
@@ -108,21 +123,16 @@ class AlbumsDatabase:
             sql.execute("UPDATE albums set mtime=? WHERE rowid=?",
                         (mtime, album_id))
 
-    def set_popularity(self, album_id, popularity, commit=False):
+    def set_popularity(self, album_id, popularity):
         """
             Set popularity
             @param album_id as int
             @param popularity as int
-            @param commit as bool
+            @warning: commit needed
         """
         with SqlCursor(Lp().db) as sql:
-            try:
-                sql.execute("UPDATE albums set popularity=? WHERE rowid=?",
-                            (popularity, album_id))
-                if commit:
-                    sql.commit()
-            except:  # Database is locked
-                pass
+            sql.execute("UPDATE albums set popularity=? WHERE rowid=?",
+                        (popularity, album_id))
 
     def get_popularity(self, album_id):
         """
@@ -143,7 +153,7 @@ class AlbumsDatabase:
         """
             Increment popularity field for album id
             @param int
-            @raise sqlite3.OperationalError on db update
+            @warning: commit needed
         """
         with SqlCursor(Lp().db) as sql:
             result = sql.execute("SELECT popularity from albums WHERE rowid=?",
@@ -156,7 +166,6 @@ class AlbumsDatabase:
             current += 1
             sql.execute("UPDATE albums set popularity=? WHERE rowid=?",
                         (current, album_id))
-            sql.commit()
 
     def get_avg_popularity(self):
         """
@@ -244,6 +253,38 @@ class AlbumsDatabase:
                 return v[0]
             return None
 
+    def get_keys(self):
+        """
+            Get all albums keys
+            @return [(album id as int, name as string, artist id as int,
+                      no album artist as bool, year as int, path as string)]
+        """
+        with SqlCursor(Lp().db) as sql:
+            result = sql.execute("SELECT rowid, name, artist_id,\
+                                  no_album_artist, year, path\
+                                  FROM albums ORDER BY rowid")
+            return list(result)
+
+    def get_compilation_artist_ids(self):
+        """
+            Get track artists for albums without album artist
+            @return {album id as int: artist ids as set(int)}
+        """
+        with SqlCursor(Lp().db) as sql:
+            result = sql.execute("SELECT DISTINCT tracks.album_id,\
+                                  track_artists.artist_id\
+                                  FROM albums, tracks, track_artists\
+                                  WHERE albums.no_album_artist=1\
+                                  AND tracks.album_id=albums.rowid\
+                                  AND track_artists.track_id=tracks.rowid")
+            artist_ids = {}
+            for (album_id, artist_id) in result:
+                if album_id in artist_ids:
+                    artist_ids[album_id].add(artist_id)
+                else:
+                    artist_ids[album_id] = {artist_id}
+            return artist_ids
+
     def get_genre_ids(self, album_id):
         """
             Get genre ids
@@ -314,6 +355,37 @@ class AlbumsDatabase:
                 return str(v[0])
             return ""
 
+    def get_rows(self, album_ids):
+        """
+            Get albums fields, one query for many albums
+            Values are those returned by get_name(), get_artist_name(), ...
+            Path is not included, get_path() checks it on disk
+            @param album_ids as [int]
+            @return {album id as int: (name as str, artist name as str,
+                                       artist id as int, year as str)}
+            @thread safe
+        """
+        rows = {}
+        album_ids = list(set([album_id for album_id in album_ids
+                              if album_id is not None and album_id >= 0]))
+        with SqlCursor(Lp().db) as sql:
+            for i in range(0, len(album_ids), self._ROWS_CHUNK):
+                chunk = album_ids[i:i + self._ROWS_CHUNK]
+                result = sql.execute(
+                    "SELECT albums.rowid, albums.name, artists.name,\
+                            albums.artist_id, albums.year\
+                     FROM albums LEFT JOIN artists\
+                     ON artists.rowid=albums.artist_id\
+                     WHERE albums.rowid IN (%s)" % ",".join("?" * len(chunk)),
+                    chunk)
+                for (album_id, name, artist_name,
+                     artist_id, year) in result:
+                    if artist_name is not None:
+                        artist_name = translate_artist_name(artist_name)
+                    rows[album_id] = (name, artist_name, artist_id,
+                                      str(year) if year else "")
+        return rows
+
     def get_path(self, album_id):
         """
             Get album path for album id
@@ -333,9 +405,7 @@ class AlbumsDatabase:
                     filepath = Lp().tracks.get_path(tracks[0])
                     path = os.path.dirname(filepath)
                     if os.path.exists(path):
-                        sql.execute("UPDATE albums SET path=? "
-                                    "WHERE rowid=?", (path, album_id))
-                        sql.commit()
+                        Lp().writer.add(self.set_path, album_id, path)
             return path
 
     def get_path_count(self, path):
@@ -655,18 +725,6 @@ class AlbumsDatabase:
                 return v[0]
             return 0
 
-    def search(self, string):
-        """
-            Search for albums looking like string
-            @param string
-            return: Array of (id as int, artist_id as int)
-        """
-        with SqlCursor(Lp().db) as sql:
-            result = sql.execute("SELECT rowid, artist_id FROM albums\
-                                  WHERE name LIKE ?\
-                                  LIMIT 25", ('%' + string + '%',))
-            return list(result)
-
     def is_compilation(self, album_id):
         """
             True if is a compilation
@@ -697,69 +755,120 @@ class AlbumsDatabase:
                 return v[0]
             return 0
 
-    def get_stats(self, duration, count):
+    def update_fingerprints(self, fingerprints):
+        """
+            Update albums track count and duration
+            @param fingerprints as [(album id as int, count delta as int,
+                                     duration delta as int)]
+            @warning: commit needed
+        """
+        with SqlCursor(Lp().db) as sql:
+            sql.executemany("INSERT OR IGNORE INTO album_fingerprints\
+                             (album_id, count, duration) VALUES (?, 0, 0)",
+                            [(f[0],) for f in fingerprints])
+            sql.executemany("UPDATE album_fingerprints\
+                             SET count=count+?2, duration=duration+?3\
+                             WHERE album_id=?1", fingerprints)
+
+    def get_fingerprint(self, album_id):
+        """
+            Get album track count and duration
+            @param album id as int
+            @return (count as int, duration as int) or None
+        """
+        with SqlCursor(Lp().db) as sql:
+            result = sql.execute("SELECT count, duration\
+                                  FROM album_fingerprints\
+                                  WHERE album_id=?", (album_id,))
+            return result.fetchone()
+
+    def get_tracks_stats(self, track_ids):
+        """
+            Get fingerprint and stats of tracks albums
+            @param track_ids as [int]
+            @return {album id as int: (count as int, duration as int,
+                                       popularity as int, mtime as int)}
         """
-            Get stats for album with same duration and track count
-            @param path as str
-            @param duration as int
+        stats = {}
+        track_ids = list(track_ids)
+        with SqlCursor(Lp().db) as sql:
+            for i in range(0, len(track_ids), self._ROWS_CHUNK):
+                chunk = track_ids[i:i + self._ROWS_CHUNK]
+                result = sql.execute(
+                    "SELECT albums.rowid, album_fingerprints.count,\
+                            album_fingerprints.duration,\
+                            albums.popularity, albums.mtime\
+                     FROM albums, album_fingerprints\
+                     WHERE album_fingerprints.album_id=albums.rowid\
+                     AND albums.rowid IN (SELECT album_id FROM tracks\
+                                          WHERE rowid IN (%s))" %
+                    ",".join("?" * len(chunk)), chunk)
+                for row in result:
+                    stats[row[0]] = row[1:]
+        return stats
+
+    def get_stats(self, album_id):
+        """
+            Get stats for another album with same duration and track count
+            @param album id as int
             @return (popularity, mtime) as (int, int)
         """
         with SqlCursor(Lp().db) as sql:
-            sql.execute("CREATE TEMP TABLE stats (album_id INT,\
-                                                  count INT,\
-                                                  duration INT)")
-            sql.execute("INSERT INTO stats (album_id, count, duration)\
-                            SELECT album_id,\
-                                   COUNT(tracks.rowid),\
-                                   SUM(tracks.duration)\
-                            FROM tracks GROUP BY album_id")
-            result = sql.execute("SELECT album_id\
-                                  FROM stats\
-                                  WHERE count=? and duration=?",
-                                 (count, duration))
+            result = sql.execute("SELECT albums.popularity, albums.mtime\
+                                  FROM album_fingerprints AS new,\
+                                  album_fingerprints AS old, albums\
+                                  WHERE new.album_id=?\
+                                  AND old.count=new.count\
+                                  AND old.duration=new.duration\
+                                  AND old.album_id!=new.album_id\
+                                  AND albums.rowid=old.album_id\
+                                  ORDER BY old.album_id LIMIT 1",
+                                 (album_id,))
             v = result.fetchone()
-            ret = None
             if v is not None:
-                result = sql.execute("SELECT popularity, mtime\
-                                      FROM albums\
-                                      WHERE rowid=?", (v[0],))
-                v = result.fetchone()
-                if v is not None:
-                    ret = v
-            return ret
+                return v
+            return None
 
-    def clean(self, album_id):
+    def clean(self, album_ids):
         """
-            Clean database for album id
-            @param album id as int
-            @param return True if album deleted or genre modified
+            Clean database for album ids, remove albums without tracks and
+            genres without tracks in album
+            @param album_ids as [int]
+            @return (modified album ids as [int], deleted album ids as [int])
             @warning commit needed
         """
         with SqlCursor(Lp().db) as sql:
-            ret = False
-            # Check album really have tracks from its genres
-            for genre_id in self.get_genre_ids(album_id):
-                result = sql.execute("SELECT track_id\
-                                      FROM tracks, track_genres\
-                                      WHERE track_genres.track_id ==\
-                                      tracks.rowid\
-                                      AND tracks.album_id=?\
-                                      AND track_genres.genre_id=?",
-                                     (album_id, genre_id))
-                v = result.fetchone()
-                if not v:
-                    ret = True
-                    sql.execute("DELETE from album_genres\
-                                 WHERE album_id=?\
-                                 AND genre_id=?", (album_id, genre_id))
-
-            # Remove album if orphaned
-            result = sql.execute("SELECT rowid from tracks\
-                                  WHERE album_id=?\
-                                  LIMIT 1", (album_id,))
-            v = result.fetchone()
-            # Album empty, remove it
-            if not v:
-                ret = True
-                sql.execute("DELETE FROM albums WHERE rowid=?", (album_id,))
-            return ret
+            sql.execute("CREATE TEMP TABLE IF NOT EXISTS cleaned_albums\
+                         (id INTEGER PRIMARY KEY)")
+            sql.execute("DELETE FROM cleaned_albums")
+            sql.executemany("INSERT OR IGNORE INTO cleaned_albums (id)\
+                             VALUES (?)", [(album_id,)
+                                           for album_id in album_ids])
+            # Check albums really have tracks from their genres
+            result = sql.execute("SELECT album_id, genre_id FROM album_genres\
+                                  WHERE album_id IN\
+                                  (SELECT id FROM cleaned_albums)")
+            album_genres = set(result)
+            result = sql.execute("SELECT DISTINCT tracks.album_id,\
+                                  track_genres.genre_id\
+                                  FROM tracks, track_genres\
+                                  WHERE track_genres.track_id=tracks.rowid\
+                                  AND tracks.album_id IN\
+                                  (SELECT id FROM cleaned_albums)")
+            orphans = album_genres - set(result)
+            sql.executemany("DELETE FROM album_genres\
+                             WHERE album_id=? AND genre_id=?", orphans)
+            # Remove albums without tracks
+            result = sql.execute("SELECT id FROM cleaned_albums\
+                                  EXCEPT SELECT album_id FROM tracks\
+                                  WHERE album_id IN\
+                                  (SELECT id FROM cleaned_albums)")
+            deleted = list(itertools.chain(*result))
+            sql.executemany("DELETE FROM albums WHERE rowid=?",
+                            [(album_id,) for album_id in deleted])
+            sql.executemany("DELETE FROM album_genres WHERE album_id=?",
+                            [(album_id,) for album_id in deleted])
+            sql.executemany("DELETE FROM album_fingerprints WHERE album_id=?",
+                            [(album_id,) for album_id in deleted])
+            modified = {album_id for (album_id, genre_id) in orphans}
+            return (list(modified | set(deleted)), deleted)
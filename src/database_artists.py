@@ -15,7 +15,7 @@ import itertools
 
 from lollypop.sqlcursor import SqlCursor
 from lollypop.define import Lp, Type
-from lollypop.utils import translate_artist_name, format_artist_name
+from lollypop.utils import translate_artist_name
 
 
 class ArtistsDatabase:
@@ -55,6 +55,17 @@ class ArtistsDatabase:
                 return v[0]
             return None
 
+    def get_name_ids(self):
+        """
+            Get all artists ids
+            @return {artist name as string: artist id as int}
+        """
+        with SqlCursor(Lp().db) as sql:
+            # Lower id wins, as with get_id()
+            result = sql.execute("SELECT name, rowid FROM artists\
+                                  ORDER BY rowid DESC")
+            return dict(result)
+
     def get_name(self, artist_id):
         """
             Get artist name
@@ -140,20 +151,6 @@ class ArtistsDatabase:
                 return bool(v[0])
             return False
 
-    def search(self, string):
-        """
-            Search for artists looking like string
-            @param string
-            @return Array of id as int
-        """
-        with SqlCursor(Lp().db) as sql:
-            result = sql.execute("SELECT rowid FROM artists\
-                                  WHERE name LIKE ?\
-                                  LIMIT 25", ('%' +
-                                              format_artist_name(string) +
-                                              '%',))
-            return list(itertools.chain(*result))
-
     def count(self):
         """
             Count artists
@@ -166,24 +163,24 @@ class ArtistsDatabase:
                 return v[0]
             return 0
 
-    def clean(self, artist_id):
+    def clean(self, artist_ids):
         """
-            Clean database for artist id
-            @param artist id as int
+            Clean database for artist ids, remove artists without
+            albums and tracks
+            @param artist_ids as [int]
             @warning commit needed
         """
         with SqlCursor(Lp().db) as sql:
-            result = sql.execute("SELECT rowid from albums\
-                                  WHERE artist_id=?\
-                                  LIMIT 1", (artist_id,))
-            v = result.fetchone()
-            # Check tracks
-            if not v:
-                result = sql.execute("SELECT track_id from track_artists\
-                                     WHERE artist_id=?\
-                                     LIMIT 1", (artist_id,))
-                v = result.fetchone()
-                # Artist with no relation, remove
-                if not v:
-                    sql.execute("DELETE FROM artists WHERE rowid=?",
-                                (artist_id,))
+            sql.execute("CREATE TEMP TABLE IF NOT EXISTS cleaned_artists\
+                         (id INTEGER PRIMARY KEY)")
+            sql.execute("DELETE FROM cleaned_artists")
+            sql.executemany("INSERT OR IGNORE INTO cleaned_artists (id)\
+                             VALUES (?)", [(artist_id,)
+                                           for artist_id in artist_ids])
+            sql.execute("DELETE FROM artists WHERE rowid IN\
+                         (SELECT id FROM cleaned_artists\
+                          EXCEPT SELECT artist_id FROM albums\
+                          WHERE artist_id IN (SELECT id FROM cleaned_artists)\
+                          EXCEPT SELECT artist_id FROM track_artists\
+                          WHERE artist_id IN\
+                          (SELECT id FROM cleaned_artists))")
@@ -0,0 +1,65 @@
+# Copyright (c) 2014-2015 Cedric Bellegarde <cedric.bellegarde@adishatz.org>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+
+from lollypop.sqlcursor import SqlCursor
+from lollypop.define import Lp
+
+
+class DirsDatabase:
+    """
+        Scanned directories database helper
+    """
+
+    def __init__(self):
+        """
+            Init dirs database object
+        """
+        pass
+
+    def get_mtimes(self):
+        """
+            Get mtime for dirs seen at last scan
+            @return {path as string: mtime in nanoseconds as int}
+        """
+        with SqlCursor(Lp().db) as sql:
+            result = sql.execute("SELECT path, mtime FROM dirs")
+            return dict(result)
+
+    def set_mtimes(self, mtimes, paths=None):
+        """
+            Replace scanned dirs
+            @param mtimes as {path as string: mtime in nanoseconds as int}
+            @param paths as [str], only replace dirs in paths, default all
+            @warning: commit needed
+        """
+        with SqlCursor(Lp().db) as sql:
+            if paths is None:
+                sql.execute("DELETE FROM dirs")
+            for path in paths or []:
+                prefix = os.path.join(path, '')
+                sql.execute("DELETE FROM dirs WHERE path=?\
+                             OR substr(path, 1, ?)=?",
+                            (path, len(prefix), prefix))
+            sql.executemany("INSERT INTO dirs (path, mtime) VALUES (?, ?)",
+                            mtimes.items())
+
+    def add_mtimes(self, mtimes):
+        """
+            Add or update scanned dirs
+            @param mtimes as {path as string: mtime in nanoseconds as int}
+            @warning: commit needed
+        """
+        with SqlCursor(Lp().db) as sql:
+            sql.executemany("INSERT OR REPLACE INTO dirs (path, mtime)\
+                             VALUES (?, ?)", mtimes.items())
@@ -54,6 +54,17 @@ class GenresDatabase:
                 return v[0]
             return None
 
+    def get_name_ids(self):
+        """
+            Get all genres ids
+            @return {genre name as string: genre id as int}
+        """
+        with SqlCursor(Lp().db) as sql:
+            # Lower id wins, as with get_id()
+            result = sql.execute("SELECT name, rowid FROM genres\
+                                  ORDER BY rowid DESC")
+            return dict(result)
+
     def get_name(self, genre_id):
         """
             Get genre name for genre id
@@ -112,16 +123,20 @@ class GenresDatabase:
                                   ORDER BY name COLLATE NOCASE")
             return list(itertools.chain(*result))
 
-    def clean(self, genre_id):
+    def clean(self, genre_ids):
         """
-            Clean database for genre id
-            @param genre id as int
+            Clean database for genre ids, remove genres without tracks
+            @param genre_ids as [int]
             @warning commit needed
         """
         with SqlCursor(Lp().db) as sql:
-            result = sql.execute("SELECT track_id from track_genres\
-                                 WHERE genre_id=?\
-                                 LIMIT 1", (genre_id,))
-            v = result.fetchone()
-            if not v:
-                sql.execute("DELETE FROM genres WHERE rowid=?", (genre_id,))
+            sql.execute("CREATE TEMP TABLE IF NOT EXISTS cleaned_genres\
+                         (id INTEGER PRIMARY KEY)")
+            sql.execute("DELETE FROM cleaned_genres")
+            sql.executemany("INSERT OR IGNORE INTO cleaned_genres (id)\
+                             VALUES (?)", [(genre_id,)
+                                           for genre_id in genre_ids])
+            sql.execute("DELETE FROM genres WHERE rowid IN\
+                         (SELECT id FROM cleaned_genres\
+                          EXCEPT SELECT genre_id FROM track_genres\
+                          WHERE genre_id IN (SELECT id FROM cleaned_genres))")
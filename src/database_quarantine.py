@@ -0,0 +1,67 @@
+# Copyright (c) 2014-2015 Cedric Bellegarde <cedric.bellegarde@adishatz.org>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from lollypop.sqlcursor import SqlCursor
+from lollypop.define import Lp
+
+
+class QuarantineDatabase:
+    """
+        Files that failed to be discovered, skipped until they change
+    """
+
+    def __init__(self):
+        """
+            Init quarantine database object
+        """
+        pass
+
+    def add(self, path, mtime, error):
+        """
+            Add file to quarantine
+            @param path as str
+            @param mtime as int
+            @param error as str
+            @warning: commit needed
+        """
+        with SqlCursor(Lp().db) as sql:
+            sql.execute("INSERT OR REPLACE INTO quarantine\
+                         (path, mtime, error) VALUES (?, ?, ?)",
+                        (path, mtime, error))
+
+    def remove(self, path):
+        """
+            Remove file from quarantine
+            @param path as str
+            @warning: commit needed
+        """
+        with SqlCursor(Lp().db) as sql:
+            sql.execute("DELETE FROM quarantine WHERE path=?", (path,))
+
+    def get_mtimes(self):
+        """
+            Get mtime for quarantined files
+            @return {path as str: mtime as int}
+        """
+        with SqlCursor(Lp().db) as sql:
+            result = sql.execute("SELECT path, mtime FROM quarantine")
+            return dict(result)
+
+    def get_errors(self):
+        """
+            Get quarantined files with their error
+            @return [(path as str, error as str)]
+        """
+        with SqlCursor(Lp().db) as sql:
+            result = sql.execute("SELECT path, error FROM quarantine\
+                                  ORDER BY path")
+            return list(result)
@@ -0,0 +1,145 @@
+# Copyright (c) 2014-2015 Cedric Bellegarde <cedric.bellegarde@adishatz.org>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from gettext import gettext as _
+import sqlite3
+
+from lollypop.sqlcursor import SqlCursor
+from lollypop.define import Lp, Type
+from lollypop.utils import translate_artist_name, format_artist_name
+
+
+class SearchDatabase:
+    """
+        Search albums and tracks by artist, album and track names
+    """
+    # Matching names, ranked by full text search
+    _MATCH_FTS = '''matched_artists AS (
+                        SELECT rowid AS id, rank FROM search_artists
+                        WHERE search_artists MATCH :match
+                        ORDER BY rank LIMIT :limit),
+                    matched_albums AS (
+                        SELECT rowid AS id, rank FROM search_albums
+                        WHERE search_albums MATCH :match
+                        ORDER BY rank LIMIT :limit),
+                    matched_tracks AS (
+                        SELECT rowid AS id, rank FROM search_tracks
+                        WHERE search_tracks MATCH :match
+                        ORDER BY rank LIMIT :limit)'''
+    # Same without FTS5, unranked
+    _MATCH_LIKE = '''matched_artists AS (
+                        SELECT rowid AS id, 0 AS rank FROM artists
+                        WHERE name LIKE :artist_like LIMIT :limit),
+                     matched_albums AS (
+                        SELECT rowid AS id, 0 AS rank FROM albums
+                        WHERE name LIKE :like LIMIT :limit),
+                     matched_tracks AS (
+                        SELECT rowid AS id, 0 AS rank FROM tracks
+                        WHERE name LIKE :like LIMIT :limit)'''
+    # Albums of matching artists, matching albums, tracks where matching
+    # artists are not album artist and matching tracks
+    # CROSS JOIN keeps SQLite from scanning all albums first
+    _SEARCH = '''WITH %s,
+                 results(is_track, id, rank) AS (
+                    SELECT 0, albums.rowid, matched_artists.rank
+                    FROM matched_artists, albums
+                    WHERE albums.artist_id=matched_artists.id
+                    UNION ALL
+                    SELECT 0, id, rank FROM matched_albums
+                    UNION ALL
+                    SELECT 1, track_artists.track_id, matched_artists.rank
+                    FROM matched_artists
+                    CROSS JOIN track_artists
+                            ON track_artists.artist_id=matched_artists.id
+                    CROSS JOIN tracks ON tracks.rowid=track_artists.track_id
+                    CROSS JOIN albums ON albums.rowid=tracks.album_id
+                    WHERE albums.artist_id!=matched_artists.id
+                    UNION ALL
+                    SELECT 1, id, rank FROM matched_tracks),
+                 best AS (
+                    SELECT is_track, id, MIN(rank) AS rank FROM results
+                    GROUP BY is_track, id
+                    ORDER BY rank LIMIT :limit)
+                 SELECT best.is_track, best.id, albums.rowid,
+                        albums.artist_id, artists.name,
+                        CASE best.is_track WHEN 1 THEN tracks.name
+                                           ELSE albums.name END,
+                        CASE best.is_track WHEN 1 THEN -1
+                        ELSE (SELECT COUNT(*) FROM tracks AS album_tracks
+                              WHERE album_tracks.album_id=albums.rowid)
+                        END,
+                        CASE WHEN best.is_track=1
+                             AND albums.artist_id=:compilations
+                        THEN (SELECT group_concat(track_artist.name,
+                                                  char(31))
+                              FROM track_artists, artists AS track_artist
+                              WHERE track_artists.track_id=tracks.rowid
+                              AND track_artist.rowid=track_artists.artist_id)
+                        END
+                 FROM best
+                 LEFT JOIN tracks ON best.is_track=1
+                                  AND tracks.rowid=best.id
+                 JOIN albums ON albums.rowid=CASE best.is_track
+                                             WHEN 1 THEN tracks.album_id
+                                             ELSE best.id END
+                 LEFT JOIN artists ON artists.rowid=albums.artist_id
+                 ORDER BY best.rank'''
+
+    def __init__(self):
+        """
+            Init search database object
+        """
+        pass
+
+    def search(self, string, limit=50):
+        """
+            Search albums and tracks matching string, best matches first
+            Words are matched by prefix, ignoring case and diacritics
+            @param string as str
+            @param limit as int
+            @return [(is track as bool, id as int, album id as int,
+                      artist as str, title as str, count as int)]
+            @thread safe
+        """
+        words = string.split()
+        if not words:
+            return []
+        # Quote words so that FTS syntax is not interpreted
+        match = " ".join('"%s"*' % word.replace('"', '""') for word in words)
+        params = {'match': match,
+                  'like': '%' + string + '%',
+                  'artist_like': '%' + format_artist_name(string) + '%',
+                  'limit': limit,
+                  'compilations': Type.COMPILATIONS}
+        with SqlCursor(Lp().db) as sql:
+            try:
+                result = sql.execute(self._SEARCH % self._MATCH_FTS, params)
+                rows = result.fetchall()
+            except sqlite3.OperationalError as e:
+                print("SearchDatabase::search(): %s" % e)
+                result = sql.execute(self._SEARCH % self._MATCH_LIKE, params)
+                rows = result.fetchall()
+        items = []
+        for (is_track, item_id, album_id, artist_id,
+             artist, title, count, track_artists) in rows:
+            if track_artists is not None:
+                artist = ", ".join([translate_artist_name(name)
+                                    for name in track_artists.split("\x1f")])
+            elif artist_id == Type.COMPILATIONS:
+                artist = _("Many artists")
+            elif artist is not None:
+                artist = translate_artist_name(artist)
+            else:
+                artist = _("Unknown")
+            items.append((is_track == 1, item_id, album_id,
+                          artist, title, count))
+        return items
@@ -10,10 +10,9 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
-from gi.repository import GLib
-
 from gettext import gettext as _
 import itertools
+import os
 
 from lollypop.sqlcursor import SqlCursor
 from lollypop.define import Lp, Type
@@ -25,6 +24,8 @@ class TracksDatabase:
         All functions take a sqlite cursor as last parameter,
         set another one if you're in a thread
     """
+    # Ids per query, below SQLite host parameters limit
+    _ROWS_CHUNK = 500
 
     def __init__(self):
         """
@@ -50,20 +51,23 @@ class TracksDatabase:
             @return inserted rowid as int
             @warning: commit needed
         """
+        basename = os.path.basename(filepath)
         with SqlCursor(Lp().db) as sql:
             result = sql.execute(
                 "INSERT INTO tracks (name, filepath, duration, tracknumber,\
-                discnumber, album_id, year, popularity, ltime, mtime) VALUES\
-                (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", (name,
-                                                  filepath,
-                                                  duration,
-                                                  tracknumber,
-                                                  discnumber,
-                                                  album_id,
-                                                  year,
-                                                  popularity,
-                                                  ltime,
-                                                  mtime))
+                discnumber, album_id, year, popularity, ltime, mtime,\
+                basename) VALUES\
+                (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", (name,
+                                                     filepath,
+                                                     duration,
+                                                     tracknumber,
+                                                     discnumber,
+                                                     album_id,
+                                                     year,
+                                                     popularity,
+                                                     ltime,
+                                                     mtime,
+                                                     basename))
             return result.lastrowid
 
     def add_artist(self, track_id, artist_id):
@@ -94,6 +98,61 @@ class TracksDatabase:
                             "track_genres (track_id, genre_id)"
                             "VALUES (?, ?)", (track_id, genre_id))
 
+    def add_all(self, tracks):
+        """
+            Add many tracks to database, SQLite gives them their ids
+            @param tracks as [(name as str, filepath as str,
+                               duration as int, tracknumber as int,
+                               discnumber as int, album_id as int,
+                               year as int, popularity as int,
+                               ltime as int, mtime as int, basename as str,
+                               device as int, inode as int, size as int)]
+            @return {filepath as str: track id as int}
+            @warning: commit needed
+        """
+        track_ids = {}
+        with SqlCursor(Lp().db) as sql:
+            sql.executemany("INSERT INTO tracks (name, filepath,\
+                             duration, tracknumber, discnumber, album_id,\
+                             year, popularity, ltime, mtime, basename,\
+                             device, inode, size)\
+                             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,\
+                                     ?, ?, ?)",
+                            tracks)
+            # Read ids back, last inserted wins for a path
+            filepaths = [track[1] for track in tracks]
+            for i in range(0, len(filepaths), self._ROWS_CHUNK):
+                chunk = filepaths[i:i + self._ROWS_CHUNK]
+                result = sql.execute("SELECT filepath, MAX(rowid)\
+                                      FROM tracks\
+                                      WHERE filepath IN (%s)\
+                                      GROUP BY filepath" %
+                                     ",".join("?" * len(chunk)), chunk)
+                track_ids.update(result)
+        return track_ids
+
+    def add_artists(self, track_artists):
+        """
+            Add artists to new tracks
+            @param track_artists as [(track id as int, artist id as int)]
+            @warning: commit needed
+        """
+        with SqlCursor(Lp().db) as sql:
+            sql.executemany("INSERT INTO "
+                            "track_artists (track_id, artist_id)"
+                            "VALUES (?, ?)", track_artists)
+
+    def add_genres(self, track_genres):
+        """
+            Add genres to new tracks
+            @param track_genres as [(track id as int, genre id as int)]
+            @warning: commit needed
+        """
+        with SqlCursor(Lp().db) as sql:
+            sql.executemany("INSERT INTO "
+                            "track_genres (track_id, genre_id)"
+                            "VALUES (?, ?)", track_genres)
+
     def get_ids(self):
         """
             Return all tracks id
@@ -141,6 +200,38 @@ class TracksDatabase:
                                  ('%' + path + '%',))
             return list(itertools.chain(*result))
 
+    def get_ids_in_dir(self, path):
+        """
+            Return tracks ids for files under path
+            @param path as str
+            @return track ids as [int]
+        """
+        path = os.path.join(path, "")
+        with SqlCursor(Lp().db) as sql:
+            result = sql.execute("SELECT rowid FROM tracks\
+                                  WHERE substr(filepath, 1, ?)=?",
+                                 (len(path), path))
+            return list(itertools.chain(*result))
+
+    def get_id_by_identity(self, device, inode, size, mtime):
+        """
+            Return track id for file identity
+            @param device as int
+            @param inode as int
+            @param size as int
+            @param mtime as int
+            @return track id as int
+        """
+        with SqlCursor(Lp().db) as sql:
+            result = sql.execute("SELECT rowid FROM tracks\
+                                  WHERE inode=? AND device=?\
+                                  AND size=? AND mtime=?",
+                                 (inode, device, size, mtime))
+            v = result.fetchone()
+            if v is not None:
+                return v[0]
+            return None
+
     def get_id_by(self, name, album_id):
         """
             Return track id for path
@@ -254,6 +345,77 @@ class TracksDatabase:
             artists = [translate_artist_name(row[0]) for row in result]
             return ", ".join(artists)
 
+    def get_rows(self, track_ids):
+        """
+            Get tracks fields, one query for many tracks
+            Values are those returned by get_name(), get_album_id(), ...
+            @param track_ids as [int]
+            @return {track id as int: (name as str, album id as int,
+                                       album artist id as int,
+                                       artist ids as [int],
+                                       album name as str,
+                                       artist names as str,
+                                       genre names as str,
+                                       duration as int, number as int,
+                                       path as str, position as int)}
+            @thread safe
+        """
+        rows = {}
+        track_ids = list(set([track_id for track_id in track_ids
+                              if track_id is not None and track_id >= 0]))
+        with SqlCursor(Lp().db) as sql:
+            for i in range(0, len(track_ids), self._ROWS_CHUNK):
+                chunk = track_ids[i:i + self._ROWS_CHUNK]
+                result = sql.execute(
+                    "SELECT tracks.rowid, tracks.name, tracks.album_id,\
+                            albums.artist_id, albums.name,\
+                            (SELECT group_concat(artist_id)\
+                             FROM track_artists\
+                             WHERE track_id=tracks.rowid),\
+                            (SELECT group_concat(artists.name, char(31))\
+                             FROM artists, track_artists\
+                             WHERE track_artists.track_id=tracks.rowid\
+                             AND track_artists.artist_id=artists.rowid),\
+                            (SELECT group_concat(genres.name, char(31))\
+                             FROM genres, track_genres\
+                             WHERE track_genres.track_id=tracks.rowid\
+                             AND track_genres.genre_id=genres.rowid),\
+                            tracks.duration, tracks.tracknumber,\
+                            tracks.filepath\
+                     FROM tracks LEFT JOIN albums\
+                     ON albums.rowid=tracks.album_id\
+                     WHERE tracks.rowid IN (%s)" % ",".join("?" * len(chunk)),
+                    chunk)
+                for (track_id, name, album_id, album_artist_id, album_name,
+                     artist_ids, artist_names, genre_names,
+                     duration, number, path) in result:
+                    if album_artist_id is None:
+                        album_artist_id = Type.COMPILATIONS
+                    if album_name is None:
+                        album_name = _("Unknown")
+                    if artist_ids is None:
+                        artist_ids = []
+                    else:
+                        artist_ids = [int(artist_id)
+                                      for artist_id in artist_ids.split(",")]
+                    if artist_names is None:
+                        artist_names = ""
+                    else:
+                        artist_names = ", ".join(
+                                        [translate_artist_name(artist)
+                                         for artist in artist_names.split(
+                                                                    "\x1f")])
+                    if genre_names is None:
+                        genre_names = ""
+                    else:
+                        genre_names = ", ".join(genre_names.split("\x1f"))
+                    position = number if number is not None else 0
+                    rows[track_id] = (name, album_id, album_artist_id,
+                                      artist_ids, album_name, artist_names,
+                                      genre_names, duration, number, path,
+                                      position)
+        return rows
+
     def get_genre_ids(self, track_id):
         """
             Get genre ids
@@ -279,19 +441,32 @@ class TracksDatabase:
             genres = [row[0] for row in result]
             return ", ".join(genres)
 
-    def get_mtimes(self):
+    def get_files(self):
         """
-            Get mtime for tracks
+            Get known files
             WARNING: Should be called before anything is shown on screen
-            @param None
-            @return dict of {filepath as string: mtime as int}
+            @return {filepath as str: (track id as int, mtime as int,
+                                       device as int, inode as int,
+                                       size as int)}
         """
         with SqlCursor(Lp().db) as sql:
-            mtimes = {}
-            result = sql.execute("SELECT filepath, mtime FROM tracks")
-            for row in result:
-                mtimes.update((row,))
-            return mtimes
+            result = sql.execute("SELECT filepath, rowid, mtime,\
+                                  device, inode, size FROM tracks")
+            return {row[0]: row[1:] for row in result}
+
+    def get_mtime(self, track_id):
+        """
+            Get track mtime
+            @param track id as int
+            @return mtime as int
+        """
+        with SqlCursor(Lp().db) as sql:
+            result = sql.execute("SELECT mtime FROM tracks WHERE rowid=?",
+                                 (track_id,))
+            v = result.fetchone()
+            if v is not None:
+                return v[0]
+            return 0
 
     def get_infos(self, track_id):
         """
@@ -390,22 +565,6 @@ class TracksDatabase:
                 return v[0] == 0
             return True
 
-    def get_as_non_album_artist(self, artist_id):
-        """
-            Get tracks for artist_id where artist_id isn't main artist
-            @param artist id as int
-            @return list of [tracks id as int, track name as string]
-        """
-        with SqlCursor(Lp().db) as sql:
-            result = sql.execute("SELECT tracks.rowid, tracks.name\
-                                  FROM tracks, track_artists, albums\
-                                  WHERE albums.rowid == tracks.album_id\
-                                  AND track_artists.artist_id=?\
-                                  AND track_artists.track_id=tracks.rowid\
-                                  AND albums.artist_id != ?", (artist_id,
-                                                               artist_id))
-            return list(result)
-
     def get_populars(self):
         """
             Return most listened to tracks
@@ -436,7 +595,7 @@ class TracksDatabase:
         """
             Increment popularity field
             @param track id as int
-            @raise sqlite3.OperationalError on db update
+            @warning: commit needed
         """
         with SqlCursor(Lp().db) as sql:
             result = sql.execute("SELECT popularity from tracks WHERE rowid=?",
@@ -449,18 +608,6 @@ class TracksDatabase:
             current += 1
             sql.execute("UPDATE tracks set popularity=? WHERE rowid=?",
                         (current, track_id))
-            sql.commit()
-
-    def set_listened_at(self, track_id, time):
-        """
-            Set ltime for track
-            @param track id as int
-            @param time as int
-        """
-        with SqlCursor(Lp().db) as sql:
-            sql.execute("UPDATE tracks set ltime=? WHERE rowid=?",
-                        (time, track_id))
-            sql.commit()
 
     def get_never_listened_to(self):
         """
@@ -494,6 +641,29 @@ class TracksDatabase:
                                   ORDER BY random() LIMIT 100")
             return list(itertools.chain(*result))
 
+    def set_identities(self, identities):
+        """
+            Set file identity for tracks
+            @param identities as [(device as int, inode as int,
+                                   size as int, track id as int)]
+            @warning: commit needed
+        """
+        with SqlCursor(Lp().db) as sql:
+            sql.executemany("UPDATE tracks SET device=?, inode=?, size=?\
+                             WHERE rowid=?", identities)
+
+    def set_paths(self, paths):
+        """
+            Set filepath for moved tracks
+            @param paths as [(track id as int, filepath as str)]
+            @warning: commit needed
+        """
+        with SqlCursor(Lp().db) as sql:
+            sql.executemany("UPDATE tracks SET filepath=?, basename=?\
+                             WHERE rowid=?",
+                            [(filepath, os.path.basename(filepath), track_id)
+                             for (track_id, filepath) in paths])
+
     def set_ltime(self, track_id, ltime):
         """
             Set ltime
@@ -505,7 +675,7 @@ class TracksDatabase:
             sql.execute("UPDATE tracks set ltime=? WHERE rowid=?",
                         (ltime, track_id))
 
-    def set_popularity(self, track_id, popularity, commit=False):
+    def set_popularity(self, track_id, popularity):
         """
             Set popularity
             @param track id as int
@@ -513,13 +683,8 @@ class TracksDatabase:
             @warning: commit needed
         """
         with SqlCursor(Lp().db) as sql:
-            try:
-                sql.execute("UPDATE tracks set popularity=? WHERE rowid=?",
-                            (popularity, track_id))
-                if commit:
-                    sql.commit()
-            except:  # Database is locked
-                pass
+            sql.execute("UPDATE tracks set popularity=? WHERE rowid=?",
+                        (popularity, track_id))
 
     def get_popularity(self, track_id):
         """
@@ -548,30 +713,6 @@ class TracksDatabase:
                 return v[0]
             return 0
 
-    def clean(self, track_id):
-        """
-            Clean database for track id
-            @param track_id as int
-            @warning commit needed
-        """
-        with SqlCursor(Lp().db) as sql:
-            sql.execute("DELETE FROM track_artists\
-                         WHERE track_id = ?", (track_id,))
-            sql.execute("DELETE FROM track_genres\
-                         WHERE track_id = ?", (track_id,))
-
-    def search(self, searched):
-        """
-            Search for tracks looking like searched
-            @param searched as string
-            return: list of [id as int, name as string]
-        """
-        with SqlCursor(Lp().db) as sql:
-            result = sql.execute("SELECT rowid, name FROM tracks\
-                                  WHERE name LIKE ? LIMIT 25",
-                                 ('%' + searched + '%',))
-            return list(result)
-
     def get_stats(self, path, duration):
         """
             Get stats for track with filename and duration
@@ -580,12 +721,11 @@ class TracksDatabase:
             @return (popularity, mtime) as (int, int)
         """
         with SqlCursor(Lp().db) as sql:
-            name = GLib.path_get_basename(path)
             result = sql.execute("SELECT popularity, ltime\
                                   FROM tracks\
-                                  WHERE filepath LIKE ?\
+                                  WHERE basename=?\
                                   AND duration=?",
-                                 ('%' + name + '%', duration))
+                                 (os.path.basename(path), duration))
             v = result.fetchone()
             if v is not None:
                 return v
@@ -611,15 +751,46 @@ class TracksDatabase:
                 return track_id
         return None
 
-    def remove(self, track_id):
+    def remove(self, track_ids):
         """
-            Remove track
-            @param track id as int
+            Remove tracks
+            @param track_ids as [int]
+            @return (album fingerprints changes as [(album id as int,
+                                                      count as int,
+                                                      duration as int)],
+                     artist ids as [int], including album artists,
+                     genre ids as [int])
+            @warning: commit needed
         """
         with SqlCursor(Lp().db) as sql:
+            sql.execute("CREATE TEMP TABLE IF NOT EXISTS deleted_tracks\
+                         (id INTEGER PRIMARY KEY)")
+            sql.execute("DELETE FROM deleted_tracks")
+            sql.executemany("INSERT OR IGNORE INTO deleted_tracks (id)\
+                             VALUES (?)", [(track_id,)
+                                           for track_id in track_ids])
+            result = sql.execute("SELECT album_id, -COUNT(*),\
+                                  -IFNULL(SUM(duration), 0)\
+                                  FROM tracks WHERE rowid IN\
+                                  (SELECT id FROM deleted_tracks)\
+                                  GROUP BY album_id")
+            fingerprints = list(result)
+            result = sql.execute("SELECT artist_id FROM track_artists\
+                                  WHERE track_id IN\
+                                  (SELECT id FROM deleted_tracks)\
+                                  UNION SELECT artist_id FROM albums\
+                                  WHERE rowid IN (SELECT album_id FROM tracks\
+                                  WHERE rowid IN\
+                                  (SELECT id FROM deleted_tracks))")
+            artist_ids = list(itertools.chain(*result))
+            result = sql.execute("SELECT DISTINCT genre_id FROM track_genres\
+                                  WHERE track_id IN\
+                                  (SELECT id FROM deleted_tracks)")
+            genre_ids = list(itertools.chain(*result))
             sql.execute("DELETE FROM track_genres\
-                         WHERE track_id=?", (track_id,))
+                         WHERE track_id IN (SELECT id FROM deleted_tracks)")
             sql.execute("DELETE FROM track_artists\
-                         WHERE track_id=?", (track_id,))
+                         WHERE track_id IN (SELECT id FROM deleted_tracks)")
             sql.execute("DELETE FROM tracks\
-                         WHERE rowid=?", (track_id,))
+                         WHERE rowid IN (SELECT id FROM deleted_tracks)")
+            return (fingerprints, artist_ids, genre_ids)
@@ -11,6 +11,8 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
+import os
+
 from lollypop.sqlcursor import SqlCursor
 
 
@@ -28,10 +30,64 @@ class DatabaseUpgrade:
         self._version = version
         self._db = db
         # Here are schema upgrade, key is database version,
-        # value is sql request
+        # value is sql request or function(sql cursor)
         self._UPGRADES = {
             1: "update tracks set duration=CAST(duration as INTEGER);",
-            2: "update albums set artist_id=-2001 where artist_id=-999;"
+            2: "update albums set artist_id=-2001 where artist_id=-999;",
+            3: "CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY,\
+                                                 mtime INT NOT NULL)",
+            4: "CREATE TABLE IF NOT EXISTS album_fingerprints (\
+                                        album_id INTEGER PRIMARY KEY,\
+                                        count INT NOT NULL,\
+                                        duration INT NOT NULL)",
+            5: "CREATE INDEX IF NOT EXISTS idx_album_fingerprints\
+                                    ON album_fingerprints(count, duration)",
+            6: "INSERT OR REPLACE INTO album_fingerprints\
+                                    (album_id, count, duration)\
+                                    SELECT album_id, COUNT(*),\
+                                    IFNULL(SUM(duration), 0)\
+                                    FROM tracks GROUP BY album_id",
+            7: "ALTER TABLE tracks ADD basename TEXT",
+            8: "UPDATE tracks SET basename=basename(filepath)",
+            9: "CREATE INDEX IF NOT EXISTS idx_tracks_basename\
+                                    ON tracks(basename, duration)",
+            10: "ALTER TABLE tracks ADD device INT",
+            11: "ALTER TABLE tracks ADD inode INT",
+            12: "ALTER TABLE tracks ADD size INT",
+            13: "CREATE INDEX IF NOT EXISTS idx_tracks_inode\
+                                    ON tracks(inode)",
+            14: "CREATE TABLE IF NOT EXISTS quarantine (\
+                                        path TEXT PRIMARY KEY,\
+                                        mtime INT NOT NULL,\
+                                        error TEXT)",
+            15: "CREATE INDEX IF NOT EXISTS idx_tracks_filepath\
+                                    ON tracks(filepath)",
+            16: "CREATE INDEX IF NOT EXISTS idx_tracks_album\
+                                    ON tracks(album_id, discnumber,\
+                                              tracknumber)",
+            17: "CREATE INDEX IF NOT EXISTS idx_track_artists\
+                                    ON track_artists(track_id, artist_id)",
+            18: "CREATE INDEX IF NOT EXISTS idx_track_artists_artist\
+                                    ON track_artists(artist_id, track_id)",
+            19: "CREATE INDEX IF NOT EXISTS idx_track_genres\
+                                    ON track_genres(track_id, genre_id)",
+            20: "CREATE INDEX IF NOT EXISTS idx_track_genres_genre\
+                                    ON track_genres(genre_id, track_id)",
+            21: "CREATE INDEX IF NOT EXISTS idx_album_genres\
+                                    ON album_genres(album_id, genre_id)",
+            22: "CREATE INDEX IF NOT EXISTS idx_album_genres_genre\
+                                    ON album_genres(genre_id, album_id)",
+            23: "CREATE INDEX IF NOT EXISTS idx_albums_name\
+                                    ON albums(name, artist_id, year)",
+            24: "CREATE INDEX IF NOT EXISTS idx_albums_artist\
+                                    ON albums(artist_id, year)",
+            25: "CREATE INDEX IF NOT EXISTS idx_artists_name\
+                                    ON artists(name)",
+            26: "CREATE INDEX IF NOT EXISTS idx_genres_name\
+                                    ON genres(name)",
+            27: "ANALYZE",
+            # Full text search, filled from existing names
+            28: db.create_search
                          }
 
     """
@@ -47,9 +103,14 @@ class DatabaseUpgrade:
     """
     def do_db_upgrade(self):
         with SqlCursor(self._db) as sql:
+            # Available to upgrade requests
+            sql.create_function("basename", 1, os.path.basename)
             for i in range(self._version+1, len(self._UPGRADES)+1):
                 try:
-                    sql.execute(self._UPGRADES[i])
+                    if callable(self._UPGRADES[i]):
+                        self._UPGRADES[i](sql)
+                    else:
+                        sql.execute(self._UPGRADES[i])
                 except Exception as e:
                     print("Database upgrade failed: ", e)
             sql.commit()
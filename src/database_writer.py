@@ -0,0 +1,115 @@
+# Copyright (c) 2014-2015 Cedric Bellegarde <cedric.bellegarde@adishatz.org>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from gi.repository import GLib
+
+from queue import Queue
+from threading import Thread, Event
+
+from lollypop.sqlcursor import SqlCursor
+
+
+class DatabaseWriter:
+    """
+        Run database mutations from a single thread
+        Queued jobs are grouped in transactions, a failing job is rolled
+        back alone
+    """
+    # Max jobs in a transaction
+    _BATCH_SIZE = 100
+
+    def __init__(self, db):
+        """
+            Init writer
+            @param db as Database
+        """
+        self._db = db
+        self._queue = Queue()
+        self._thread = Thread(target=self._run, name="DatabaseWriter")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def add(self, job, *args, callback=None):
+        """
+            Queue a mutation, job runs in writer thread and may use
+            SqlCursor as usual, it must not commit
+            @param job as function(*args)
+            @param args as job arguments
+            @param callback as function(result) called in main loop
+                   once job is committed, result is None on failure
+            @thread safe
+        """
+        self._queue.put((job, args, callback))
+
+    def flush(self):
+        """
+            Wait for queued jobs to be committed
+            @thread safe
+        """
+        event = Event()
+        self._queue.put((None, (event,), None))
+        event.wait()
+
+#######################
+# PRIVATE             #
+#######################
+    def _run(self):
+        """
+            Run queued jobs
+        """
+        while True:
+            jobs = [self._queue.get()]
+            while len(jobs) < self._BATCH_SIZE and not self._queue.empty():
+                jobs.append(self._queue.get())
+            results = []
+            events = []
+            with SqlCursor(self._db) as sql:
+                try:
+                    # Take write lock now, waiting for other writers
+                    sql.execute("BEGIN IMMEDIATE")
+                    for (job, args, callback) in jobs:
+                        if job is None:
+                            events += args
+                            continue
+                        results.append((callback, self._run_job(sql, job,
+                                                                args)))
+                    sql.commit()
+                except Exception as e:
+                    print("DatabaseWriter::_run(): %s" % e)
+                    if sql.in_transaction:
+                        sql.rollback()
+                    results = [(callback, None) for (callback, result)
+                               in results]
+            for (callback, result) in results:
+                if callback is not None:
+                    GLib.idle_add(callback, result)
+            for event in events:
+                event.set()
+
+    def _run_job(self, sql, job, args):
+        """
+            Run job in its own savepoint
+            @param sql as sqlite cursor
+            @param job as function(*args)
+            @param args as job arguments
+            @return job result, None on failure
+        """
+        sql.execute("SAVEPOINT job")
+        try:
+            result = job(*args)
+            sql.execute("RELEASE job")
+            return result
+        except Exception as e:
+            print("DatabaseWriter::_run_job(): %s" % e)
+            sql.execute("ROLLBACK TO job")
+            sql.execute("RELEASE job")
+            return None
@@ -51,6 +51,13 @@ class PlayContext:
     next = NextContext.NONE
 
 
+# Represent a file found by collection scanner
+class FileType:
+    NONE = 0   # Not a music file
+    AUDIO = 1
+    PLS = 2    # Playlist
+
+
 class GstPlayFlags:
     GST_PLAY_FLAG_VIDEO = 1 << 0  # We want video output
     GST_PLAY_FLAG_AUDIO = 1 << 1  # We want audio output
@@ -13,79 +13,329 @@
 from gi.repository import Gio, GLib
 
 import os
+import sys
+import errno
+import ctypes
+import struct
+from time import time, sleep
+from threading import Lock, Thread
 
-from lollypop.define import Lp
-from lollypop.utils import is_audio
+from lollypop.define import Lp, FileType
+from lollypop.utils import get_file_type, get_file_type_by_extension, debug
+
+
+def _get_libc():
+    """
+        Get libc with inotify support
+        @return ctypes.CDLL or None
+    """
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        for func in ['inotify_init1', 'inotify_add_watch',
+                     'inotify_rm_watch']:
+            getattr(libc, func)
+        return libc
+    except:
+        return None
 
 
 class Inotify:
     """
         Inotify support
+        All dirs are watched from a single inotify fd. When kernel refuses
+        new watches (max_user_watches reached) or inotify is missing, dirs
+        are polled for mtime changes instead, from a background thread
     """
     # 10 second before updating database
     _TIMEOUT = 10000
+    # Poll one chunk of polled dirs every second
+    _POLL_INTERVAL = 1
+    _POLL_CHUNK = 500
+    # Kernel memory used by a watch on 64 bits
+    _WATCH_SIZE = 1080
+
+    # From sys/inotify.h
+    _IN_CLOSE_WRITE = 0x00000008
+    _IN_MOVED_FROM = 0x00000040
+    _IN_MOVED_TO = 0x00000080
+    _IN_CREATE = 0x00000100
+    _IN_DELETE = 0x00000200
+    _IN_DELETE_SELF = 0x00000400
+    _IN_Q_OVERFLOW = 0x00004000
+    _IN_IGNORED = 0x00008000
+    _IN_ONLYDIR = 0x01000000
+    _IN_ISDIR = 0x40000000
+    _IN_NONBLOCK = os.O_NONBLOCK
+    _IN_CLOEXEC = os.O_CLOEXEC
+    _MASK = _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE |\
+        _IN_DELETE | _IN_DELETE_SELF | _IN_ONLYDIR
+    _EVENT = struct.Struct('iIII')
 
     def __init__(self):
         """
             Init inode notification
         """
-        self._monitors = {}
+        self._lock = Lock()
+        # Watch table: wd -> path and path -> wd
+        self._watches = {}
+        self._wds = {}
+        # Polled dirs: path -> (mtime, entries)
+        self._polled = {}
+        self._poll_queue = []
+        self._poll_thread = None
         self._timeout = None
+        self._overflow = False
+        # Pending changes
+        self._created = set()
+        self._deleted = set()
+        self._libc = _get_libc()
+        self._fd = -1
+        if self._libc is not None:
+            self._fd = self._libc.inotify_init1(self._IN_NONBLOCK |
+                                                self._IN_CLOEXEC)
+        if self._fd >= 0:
+            GLib.unix_fd_add_full(GLib.PRIORITY_DEFAULT_IDLE, self._fd,
+                                  GLib.IOCondition.IN, self._on_fd_ready)
+        else:
+            print("Inotify::__init__(): inotify unavailable, polling dirs")
 
     def add_monitor(self, path):
         """
             Add a monitor for path
             @param path as string
+            @thread safe
         """
         # Check if there is already a monitor for this path
-        if path in self._monitors.keys():
+        if path in self._wds or path in self._polled:
+            return
+        wd = -1
+        if self._fd >= 0:
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path),
+                                              self._MASK)
+        if wd >= 0:
+            with self._lock:
+                # Dir moved, same inode means same watch
+                old_path = self._watches.get(wd, None)
+                if old_path is not None:
+                    self._wds.pop(old_path, None)
+                self._watches[wd] = path
+                self._wds[path] = wd
+            return
+        if self._fd >= 0 and ctypes.get_errno() != errno.ENOSPC:
+            # Not a dir anymore, nothing to watch
             return
         try:
-            f = Gio.File.new_for_path(path)
-            monitor = f.monitor_directory(Gio.FileMonitorFlags.NONE,
-                                          None)
-            if monitor is not None:
-                monitor.connect('changed', self._on_dir_changed)
-                self._monitors[path] = monitor
+            entry = (os.stat(path).st_mtime_ns, frozenset(os.listdir(path)))
         except:
-            pass
+            return
+        with self._lock:
+            if not self._polled and self._fd >= 0:
+                print("Inotify::add_monitor(): watch limit reached, "
+                      "polling dirs")
+            self._polled[path] = entry
+            # Stat calls may be slow, never run them in main loop
+            if self._poll_thread is None:
+                self._poll_thread = Thread(target=self._poll_dirs)
+                self._poll_thread.daemon = True
+                self._poll_thread.start()
+
+    def add_monitors(self, paths):
+        """
+            Add monitors for paths and report watcher setup cost
+            @param paths as [string]
+            @thread safe
+        """
+        start = time()
+        for path in paths:
+            self.add_monitor(path)
+        debug("Inotify::add_monitors(): %s paths in %.2fs, %s" %
+              (len(paths), time() - start, self.get_stats()))
+
+    def get_stats(self):
+        """
+            Get watcher usage
+            @return str
+        """
+        with self._lock:
+            watches = len(self._watches)
+            polled = len(self._polled)
+            size = sys.getsizeof(self._watches) +\
+                sys.getsizeof(self._wds) +\
+                sys.getsizeof(self._polled) +\
+                sum(sys.getsizeof(path) for path in self._wds) +\
+                sum(sys.getsizeof(path) + sys.getsizeof(entry[1])
+                    for (path, entry) in self._polled.items())
+        return "%s watches (%s KiB kernel), %s polled dirs, %s KiB tables" %\
+            (watches, watches * self._WATCH_SIZE // 1024,
+             polled, size // 1024)
 
 #######################
 # PRIVATE             #
 #######################
-    def _on_dir_changed(self, monitor, changed_file, other_file, event):
+    def _on_fd_ready(self, fd, condition):
         """
-            Prepare thread to handle changes
+            Read pending inotify events
+            @param fd as int
+            @param condition as GLib.IOCondition
         """
-        # Stop collection scanner and wait
-        if Lp().scanner.is_locked():
-            Lp().scanner.stop()
-            GLib.timeout_add(1000,
-                             self._on_dir_changed,
-                             monitor,
-                             changed_file,
-                             other_file,
-                             event)
-        # Run update delayed
-        else:
-            path = changed_file.get_path()
-            # If a directory, monitor it
-            if os.path.exists(path) and\
-               changed_file.query_file_type(Gio.FileQueryInfoFlags.NONE,
-                                            None) == Gio.FileType.DIRECTORY:
-                self.add_monitor(path)
-            # If not an audio file, exit
-            elif not is_audio(changed_file):
-                return
-            if self._timeout is not None:
-                GLib.source_remove(self._timeout)
-                self._timeout = None
-            self._timeout = GLib.timeout_add(self._TIMEOUT,
-                                             self._run_collection_update)
+        try:
+            data = os.read(fd, 65536)
+        except BlockingIOError:
+            return True
+        except Exception as e:
+            print("Inotify::_on_fd_ready(): %s" % e)
+            return False
+        offset = 0
+        changed = False
+        while offset + self._EVENT.size <= len(data):
+            (wd, mask, cookie, length) = self._EVENT.unpack_from(data,
+                                                                 offset)
+            offset += self._EVENT.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if mask & self._IN_Q_OVERFLOW:
+                self._overflow = True
+                changed = True
+                continue
+            dir_path = self._watches.get(wd, None)
+            if dir_path is None:
+                continue
+            if mask & self._IN_IGNORED:
+                with self._lock:
+                    del self._watches[wd]
+                    if self._wds.get(dir_path, None) == wd:
+                        del self._wds[dir_path]
+                continue
+            if mask & self._IN_DELETE_SELF:
+                continue
+            path = os.path.join(dir_path, os.fsdecode(name))
+            if mask & (self._IN_DELETE | self._IN_MOVED_FROM):
+                self._deleted.add(path)
+                changed = True
+            elif mask & (self._IN_CREATE | self._IN_MOVED_TO |
+                         self._IN_CLOSE_WRITE):
+                if mask & self._IN_CREATE and not mask & self._IN_ISDIR:
+                    # Wait for IN_CLOSE_WRITE
+                    continue
+                changed |= self._on_path_created(path)
+        if changed:
+            self._delay_update()
+        return True
+
+    def _poll_dirs(self):
+        """
+            Check polled dirs for changes, one chunk at a time
+            Changes are sent to main loop
+            @thread safe
+        """
+        Lp().background.set_low_priority()
+        while True:
+            sleep(self._POLL_INTERVAL)
+            try:
+                Lp().background.wait()
+                (created, deleted) = self._poll_chunk()
+            except Exception as e:
+                print("Inotify::_poll_dirs(): %s" % e)
+                continue
+            if created or deleted:
+                GLib.idle_add(self._on_dirs_polled, created, deleted)
+
+    def _poll_chunk(self):
+        """
+            Check next chunk of polled dirs for changes
+            @return (created paths as [str], deleted paths as [str])
+            @thread safe
+        """
+        if not self._poll_queue:
+            with self._lock:
+                self._poll_queue = list(self._polled.keys())
+        chunk = self._poll_queue[-self._POLL_CHUNK:]
+        del self._poll_queue[-self._POLL_CHUNK:]
+        created = []
+        deleted = []
+        for path in chunk:
+            entry = self._polled.get(path, None)
+            if entry is None:
+                continue
+            try:
+                mtime = os.stat(path).st_mtime_ns
+                if mtime == entry[0]:
+                    continue
+                entries = frozenset(os.listdir(path))
+            except:
+                with self._lock:
+                    del self._polled[path]
+                continue
+            with self._lock:
+                self._polled[path] = (mtime, entries)
+            for name in entry[1] - entries:
+                deleted.append(os.path.join(path, name))
+            for name in entries - entry[1]:
+                if self._is_collection_path(os.path.join(path, name)):
+                    created.append(os.path.join(path, name))
+        return (created, deleted)
+
+    def _on_dirs_polled(self, created, deleted):
+        """
+            Add changes found in polled dirs to pending changes
+            @param created as [str]
+            @param deleted as [str]
+        """
+        self._created |= set(created)
+        self._deleted |= set(deleted)
+        self._delay_update()
+
+    def _delay_update(self):
+        """
+            Delay collection update, restart timer on new changes
+        """
+        if self._timeout is not None:
+            GLib.source_remove(self._timeout)
+            self._timeout = None
+        self._timeout = GLib.timeout_add(self._TIMEOUT,
+                                         self._run_collection_update)
+
+    def _on_path_created(self, path):
+        """
+            Add created path to pending changes if a dir or a music file
+            @param path as str
+            @return True if added
+        """
+        if not self._is_collection_path(path):
+            return False
+        self._created.add(path)
+        return True
+
+    def _is_collection_path(self, path):
+        """
+            True if path is a dir or a music file, dirs get a monitor
+            @param path as str
+            @return bool
+            @thread safe
+        """
+        # If a directory, monitor it
+        if os.path.isdir(path):
+            self.add_monitor(path)
+            return True
+        file_type = get_file_type_by_extension(path)
+        if file_type is None:
+            file_type = get_file_type(Gio.File.new_for_path(path))
+        return file_type == FileType.AUDIO
 
     def _run_collection_update(self):
         """
-            Run a collection update
+            Update collection for pending changes
+            Wait for running scan to finish
         """
+        if Lp().scanner.is_locked():
+            return True
         self._timeout = None
-        Lp().window.update_db()
+        if self._overflow:
+            # Events lost, rescan whole collection
+            self._overflow = False
+            Lp().scanner.update(None)
+        else:
+            Lp().scanner.update_files(self._created, self._deleted)
+        self._created = set()
+        self._deleted = set()
+        return False
@@ -19,7 +19,7 @@ import threading
 import os
 
 from lollypop.define import Lp, Type
-from lollypop.objects import Track
+from lollypop.objects import Track, load_tracks
 from lollypop.database_mpd import MpdDatabase
 from lollypop.utils import translate_artist_name, format_artist_name, get_ip
 
@@ -197,7 +197,8 @@ class MpdHandler(socketserver.StreamRequestHandler):
             @return msg as str
         """
         if Lp().player.current_track.id is not None:
-            msg = self._string_for_track_id(Lp().player.current_track.id)
+            msg = self._string_for_track(Track(
+                                            Lp().player.current_track.id))
         else:
             msg = ""
         return msg
@@ -248,8 +249,8 @@ class MpdHandler(socketserver.StreamRequestHandler):
         """
         msg = ""
         idx = 0
-        for track_id in self._find_tracks(cmd_args):
-            msg += self._string_for_track_id(track_id, idx)
+        for track in load_tracks(self._find_tracks(cmd_args)):
+            msg += self._string_for_track(track, idx)
             idx += 1
         return msg
 
@@ -425,8 +426,8 @@ class MpdHandler(socketserver.StreamRequestHandler):
         playlist_id = Lp().playlists.get_id(arg)
         msg = ""
         idx = 0
-        for track_id in Lp().playlists.get_tracks_ids(playlist_id):
-            msg += self._string_for_track_id(track_id, idx)
+        for track in load_tracks(Lp().playlists.get_tracks_ids(playlist_id)):
+            msg += self._string_for_track(track, idx)
             idx += 1
         return msg
 
@@ -702,7 +703,7 @@ class MpdHandler(socketserver.StreamRequestHandler):
         msg = ""
         try:
             track_id = int(self._get_args(cmd_args))
-            msg += self._string_for_track_id(track_id)
+            msg += self._string_for_track(Track(track_id))
         except:
             currents = Lp().playlists.get_tracks_ids(Type.MPD)
             if Lp().player.is_party():
@@ -711,8 +712,9 @@ class MpdHandler(socketserver.StreamRequestHandler):
                     currents.insert(0, Lp().player.prev_track.id)
                 if Lp().player.next_track.id is not None:
                     currents.append(Lp().player.next_track.id)
-            for track_id in currents:
-                msg += self._string_for_track_id(track_id)
+            tracks_ids = self._get_tracks_ids()
+            for track in load_tracks(currents):
+                msg += self._string_for_track(track, tracks_ids=tracks_ids)
         return msg
 
     def _playlistinfo(self, cmd_args):
@@ -746,12 +748,16 @@ class MpdHandler(socketserver.StreamRequestHandler):
             if Lp().player.next_track.id is not None:
                 currents.append(Lp().player.next_track.id)
         i = 0
+        wanted = []
         for track_id in currents:
             if (start is not None and start <= i <= end) or\
                (pos is not None and pos == i) or\
                (start == end == pos is None):
-                msg += self._string_for_track_id(track_id)
+                wanted.append(track_id)
             i += 1
+        tracks_ids = self._get_tracks_ids()
+        for track in load_tracks(wanted):
+            msg += self._string_for_track(track, tracks_ids=tracks_ids)
         return msg
 
     def _plchanges(self, cmd_args):
@@ -772,6 +778,7 @@ class MpdHandler(socketserver.StreamRequestHandler):
             if Lp().player.next_track.id is not None:
                 currents.append(Lp().player.next_track.id)
         previous = list(self.server.playlist[version])
+        changed = []
         while currents:
             current = currents.pop(0)
             try:
@@ -779,13 +786,16 @@ class MpdHandler(socketserver.StreamRequestHandler):
             except:
                 prev = Type.NONE
             if current != prev:
-                msg += self._string_for_track_id(current)
-                if i > 100:
-                    self.request.send(msg.encode("utf-8"))
-                    msg = ""
-                    i = 0
-                else:
-                    i += 1
+                changed.append(current)
+        tracks_ids = self._get_tracks_ids()
+        for track in load_tracks(changed):
+            msg += self._string_for_track(track, tracks_ids=tracks_ids)
+            if i > 100:
+                self.request.send(msg.encode("utf-8"))
+                msg = ""
+                i = 0
+            else:
+                i += 1
         return msg
 
     def _plchangesposid(self, cmd_args):
@@ -936,9 +946,11 @@ class MpdHandler(socketserver.StreamRequestHandler):
         if artist is not None:
             artist_id = Lp().artists.get_id(artist)
 
-        for track_id in self.server.mpddb.get_tracks_ids(album, artist_id,
-                                                         genre_id, year):
-            msg += self._string_for_track_id(track_id)
+        tracks_ids = self._get_tracks_ids()
+        for track in load_tracks(self.server.mpddb.get_tracks_ids(
+                                                album, artist_id,
+                                                genre_id, year)):
+            msg += self._string_for_track(track, tracks_ids=tracks_ids)
         return msg
 
     def _setvol(self, cmd_args):
@@ -1071,30 +1083,25 @@ class MpdHandler(socketserver.StreamRequestHandler):
         msg = "handler: http\n"
         return msg
 
-    def _string_for_track_id(self, track_id, index=Type.NONE):
+    def _string_for_track(self, track, index=Type.NONE, tracks_ids=None):
         """
-            Get mpd protocol string for track id
-            @param track id as int
+            Get mpd protocol string for track
+            @param track as Track
             @param track index as int
+            @param tracks ids as [int], from _get_tracks_ids()
             @return str
         """
-        if track_id is None:
+        if track.id is None:
             msg = ""
         else:
-            track = Track(track_id)
             if index == Type.NONE:
                 index = 0
-                if Lp().player.is_party():
-                    tracks_ids = [Lp().player.prev_track.id,
-                                  Lp().player.current_track.id,
-                                  Lp().player.next_track.id]
-                    index = tracks_ids.index(track_id)
-                else:
-                    tracks_ids = Lp().playlists.get_tracks_ids(Type.MPD)
-                    try:
-                        index = tracks_ids.index(track_id)
-                    except:
-                        pass
+                if tracks_ids is None:
+                    tracks_ids = self._get_tracks_ids()
+                try:
+                    index = tracks_ids.index(track.id)
+                except:
+                    pass
             msg = "file: %s\nArtist: %s\nAlbum: %s\nAlbumArtist: %s\
 \nTitle: %s\nDate: %s\nGenre: %s\nTime: %s\nId: %s\nPos: %s\nTrack: %s\n" % (
                      track.path,
@@ -1110,6 +1117,18 @@ class MpdHandler(socketserver.StreamRequestHandler):
                      track.position)
         return msg
 
+    def _get_tracks_ids(self):
+        """
+            Get tracks ids giving track index
+            @return [int]
+        """
+        if Lp().player.is_party():
+            return [Lp().player.prev_track.id,
+                    Lp().player.current_track.id,
+                    Lp().player.next_track.id]
+        else:
+            return Lp().playlists.get_tracks_ids(Type.MPD)
+
     def _get_status(self):
         """
             Player status
@@ -13,6 +13,7 @@
 
 
 from gi.repository import GLib
+from gettext import gettext as _
 
 from lollypop.radios import Radios
 from lollypop.define import Lp, Type
@@ -49,6 +50,14 @@ class Base:
             else:
                 return attr_value
 
+    def set_row(self, row):
+        """
+            Set fields from a database row, no more lazy DB calls for them
+            @param row as tuple, values in self.FIELDS order
+        """
+        for attr, value in zip(self.FIELDS, row):
+            setattr(self, "_" + attr, value)
+
     def get_popularity(self):
         """
             Get popularity
@@ -80,7 +89,7 @@ class Base:
             if self.id >= 0:
                 avg_popularity = self.db.get_avg_popularity()
                 popularity = int((popularity * avg_popularity / 5) + 0.5)
-                self.db.set_popularity(self.id, popularity, True)
+                Lp().writer.add(self.db.set_popularity, self.id, popularity)
             elif self.id == Type.RADIOS:
                 radios = Radios()
                 avg_popularity = radios.get_avg_popularity()
@@ -118,7 +127,7 @@ class Disc:
 
             @return list of Track
         """
-        return [Track(id) for id in self.tracks_ids]
+        return load_tracks(self.tracks_ids)
 
 
 class Album(Base):
@@ -128,15 +137,18 @@ class Album(Base):
     FIELDS = ['name', 'artist_name', 'artist_id', 'year', 'path']
     DEFAULTS = ['', '', None, '', '']
 
-    def __init__(self, album_id=None, genre_id=None):
+    def __init__(self, album_id=None, genre_id=None, row=None):
         """
             Init album
             @param album_id as int
             @param genre_id as int
+            @param row as tuple from AlbumsDatabase.get_rows()
         """
         Base.__init__(self, Lp().albums)
         self.id = album_id
         self.genre_id = genre_id
+        if row is not None:
+            self.set_row(row)
 
     def set_genre(self, genre_id):
         """
@@ -176,7 +188,7 @@ class Album(Base):
             @return list of Track
         """
         if not self._tracks and self.tracks_ids:
-            self._tracks = [Track(track_id) for track_id in self.tracks_ids]
+            self._tracks = load_tracks(self.tracks_ids)
         return self._tracks
 
     @property
@@ -199,14 +211,17 @@ class Track(Base):
               'genre_names', 'duration', 'number', 'path', 'position']
     DEFAULTS = ['', None, None, [], '', '', '', 0.0, None, '', 0]
 
-    def __init__(self, track_id=None):
+    def __init__(self, track_id=None, row=None):
         """
             Init track
             @param track_id as int
+            @param row as tuple from TracksDatabase.get_rows()
         """
         Base.__init__(self, Lp().tracks)
         self.id = track_id
         self._uri = None
+        if row is not None:
+            self.set_row(row)
 
     @property
     def title(self):
@@ -244,6 +259,8 @@ class Track(Base):
             Get track's album
             @return Album
         """
+        if getattr(self, "_album") is not None:
+            return self._album
         return Album(self.album_id)
 
     @property
@@ -282,6 +299,13 @@ class Track(Base):
         """
         return self.genre_names
 
+    def set_album(self, album):
+        """
+            Set album
+            @param album as Album
+        """
+        self._album = album
+
     def set_album_artist(self, name):
         """
             Set album artist
@@ -309,3 +333,34 @@ class Track(Base):
         self.id = Type.RADIOS
         self._album_artist = name
         self._uri = uri
+
+
+def load_tracks(track_ids):
+    """
+        Get tracks and their albums, fields loaded with one query each
+        Use it instead of Track(track_id) for many tracks
+        @param track_ids as [int]
+        @return [Track]
+        @thread safe
+    """
+    track_rows = Lp().tracks.get_rows(track_ids)
+    album_rows = Lp().albums.get_rows([row[1] for row in
+                                       track_rows.values()])
+    albums = {}
+    tracks = []
+    for track_id in track_ids:
+        track = Track(track_id, track_rows.get(track_id))
+        if track_id in track_rows:
+            album_id = track.album_id
+            if album_id not in albums:
+                albums[album_id] = Album(album_id, None,
+                                         album_rows.get(album_id))
+            album = albums[album_id]
+            track.set_album(album)
+            # Same as ArtistsDatabase.get_name()
+            if track.album_artist_id == Type.COMPILATIONS:
+                track.set_album_artist(_("Many artists"))
+            elif album.artist_name:
+                track.set_album_artist(album.artist_name)
+        tracks.append(track)
+    return tracks
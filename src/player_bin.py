@@ -52,6 +52,7 @@ class BinPlayer(ReplayGainPlayer, BasePlayer):
         bus.connect('message::element', self._on_bus_element)
         bus.connect('message::stream-start', self._on_stream_start)
         bus.connect("message::tag", self._on_bus_message_tag)
+        bus.connect('message::buffering', self._on_bus_buffering)
         self._handled_error = None
         self._start_time = 0
 
@@ -265,6 +266,15 @@ class BinPlayer(ReplayGainPlayer, BasePlayer):
             if self._codecs is not None:
                 self._codecs.append(message)
 
+    def _on_bus_buffering(self, bus, message):
+        """
+            Pause background work while buffering
+            @param bus as Gst.Bus
+            @param message as Gst.Message
+        """
+        percent = message.parse_buffering()
+        Lp().background.set_buffering(percent < 100)
+
     def _on_bus_error(self, bus, message):
         """
             Handle first bus error, ignore others
@@ -311,9 +321,8 @@ class BinPlayer(ReplayGainPlayer, BasePlayer):
         if self.next_track.id is not None:
             self._load_track(self.next_track)
         # Increment popularity
-        if not Lp().scanner.is_locked():
-            Lp().tracks.set_more_popular(finished.id)
-            Lp().albums.set_more_popular(finished.album_id)
+        Lp().writer.add(Lp().tracks.set_more_popular, finished.id)
+        Lp().writer.add(Lp().albums.set_more_popular, finished.album_id)
         # Scrobble on lastfm
         if Lp().lastfm is not None:
             if finished.album_artist_id == Type.COMPILATIONS:
@@ -347,6 +356,6 @@ class BinPlayer(ReplayGainPlayer, BasePlayer):
                                         self.current_track.album_name,
                                         self.current_track.title,
                                         int(self.current_track.duration))
-        if not Lp().scanner.is_locked():
-            Lp().tracks.set_listened_at(self.current_track.id, int(time()))
+        Lp().writer.add(Lp().tracks.set_ltime, self.current_track.id,
+                        int(time()))
         self._handled_error = None
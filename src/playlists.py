@@ -357,7 +357,8 @@ class Playlists(GObject.GObject):
             Return a new sqlite cursor
         """
         try:
-            sql = sqlite3.connect(self.DB_PATH, 600.0)
+            sql = sqlite3.connect(self.DB_PATH, 600.0,
+                                  check_same_thread=False)
             sql.execute("ATTACH DATABASE '%s' AS music" % Database.DB_PATH)
             return sql
         except:
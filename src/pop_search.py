@@ -16,6 +16,7 @@ from cgi import escape
 from threading import Thread
 
 from lollypop.define import Lp, ArtSize, Type
+from lollypop.database_search import SearchDatabase
 from lollypop.objects import Track, Album
 
 
@@ -207,44 +208,15 @@ class SearchPopover(Gtk.Popover):
             in db based on text entry current text
         """
         results = []
-        albums = []
-
-        tracks_non_album_artist = []
-
-        # Get all albums for all artists and non album_artist tracks
-        for artist_id in Lp().artists.search(self._current_search):
-            for album_id in Lp().albums.get_ids(artist_id, None):
-                if (album_id, artist_id) not in albums:
-                    albums.append((album_id, artist_id))
-            for track_id, track_name in Lp().tracks.get_as_non_album_artist(
-                                                        artist_id):
-                tracks_non_album_artist.append((track_id, track_name))
-
-        albums += Lp().albums.search(self._current_search)
-
-        for album_id, artist_id in albums:
+        for (is_track, item_id, album_id, artist, title,
+             count) in SearchDatabase().search(self._current_search):
             search_obj = SearchObject()
-            search_obj.artist = Lp().artists.get_name(artist_id)
-            search_obj.title = Lp().albums.get_name(album_id)
-            search_obj.count = Lp().albums.get_count(album_id, None)
-            search_obj.id = album_id
+            search_obj.is_track = is_track
+            search_obj.id = item_id
             search_obj.album_id = album_id
-            results.append(search_obj)
-
-        for track_id, track_name in Lp().tracks.search(
-                        self._current_search) + tracks_non_album_artist:
-            search_obj = SearchObject()
-            search_obj.title = track_name
-            search_obj.id = track_id
-            search_obj.album_id = Lp().tracks.get_album_id(track_id)
-            search_obj.is_track = True
-
-            artist_id = Lp().albums.get_artist_id(search_obj.album_id)
-            if artist_id == Type.COMPILATIONS:
-                search_obj.artist = Lp().tracks.get_artist_names(track_id)
-            else:
-                search_obj.artist = Lp().artists.get_name(artist_id)
-
+            search_obj.artist = artist
+            search_obj.title = title
+            search_obj.count = count
             results.append(search_obj)
 
         if not self._stop_thread:
@@ -223,7 +223,8 @@ class Radios(GObject.GObject):
             Return a new sqlite cursor
         """
         try:
-            return sqlite3.connect(self.DB_PATH, 600.0)
+            return sqlite3.connect(self.DB_PATH, 600.0,
+                                   check_same_thread=False)
         except:
             exit(-1)
 
@@ -11,45 +11,94 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
-from threading import current_thread
-
-from lollypop.define import Lp
+from threading import get_ident, Lock
 
 
 class SqlCursor:
     """
         Context manager to get the SQL cursor
+        Connections are taken from a pool and given back on exit, so
+        short lived threads do not pay connection setup.
+        Nested use in a thread gets the same connection
     """
+    # Idle connections by object class name
+    _pool = {}
+    _pool_lock = Lock()
+    # Max idle connections kept by object
+    _POOL_SIZE = 4
+    # Connections in use:
+    # (thread id, object class name): [connection, nesting depth]
+    # Only the thread owning a key changes its entry
+    _leases = {}
+
     def add(obj):
         """
-            Add cursor to thread list
-            Raise an exception if cursor already exists
+            Keep a connection for calling thread and obj, never given
+            back to pool
+            @param obj as Database/Playlists/Radios
         """
-        name = current_thread().getName() + obj.__class__.__name__
-        Lp().cursors[name] = obj.get_cursor()
+        key = (get_ident(), obj.__class__.__name__)
+        SqlCursor._leases[key] = [obj.get_cursor(), 1]
 
     def __init__(self, obj):
         """
             Init object
         """
         self._obj = obj
-        self._creator = False
 
     def __enter__(self):
         """
-            Store cursor if created, return thread+object cursor
+            Get thread+object cursor, from pool if none in use
         """
-        name = current_thread().getName() + self._obj.__class__.__name__
-        if name not in Lp().cursors:
-            self._creator = True
-            Lp().cursors[name] = self._obj.get_cursor()
-        return Lp().cursors[name]
+        key = (get_ident(), self._obj.__class__.__name__)
+        lease = SqlCursor._leases.get(key, None)
+        if lease is None:
+            lease = [SqlCursor._acquire(self._obj), 0]
+            SqlCursor._leases[key] = lease
+        lease[1] += 1
+        return lease[0]
 
     def __exit__(self, type, value, traceback):
         """
-            If creator, close cursor and remove it
+            Give cursor back to pool when leaving outer context
+        """
+        key = (get_ident(), self._obj.__class__.__name__)
+        lease = SqlCursor._leases[key]
+        lease[1] -= 1
+        if lease[1] == 0:
+            del SqlCursor._leases[key]
+            SqlCursor._release(self._obj, lease[0])
+
+#######################
+# PRIVATE             #
+#######################
+    def _acquire(obj):
+        """
+            Get an idle connection for obj or a new one
+            @param obj as Database/Playlists/Radios
+            @return sqlite3.Connection
+        """
+        with SqlCursor._pool_lock:
+            idle = SqlCursor._pool.get(obj.__class__.__name__, [])
+            if idle:
+                return idle.pop()
+        return obj.get_cursor()
+
+    def _release(obj, sql):
+        """
+            Give connection back to pool, close it if pool is full
+            Uncommitted changes are lost, as when closing connection
+            @param obj as Database/Playlists/Radios
+            @param sql as sqlite3.Connection
         """
-        if self._creator:
-            name = current_thread().getName() + self._obj.__class__.__name__
-            Lp().cursors[name].close()
-            del Lp().cursors[name]
+        try:
+            if sql.in_transaction:
+                sql.rollback()
+            with SqlCursor._pool_lock:
+                idle = SqlCursor._pool.setdefault(obj.__class__.__name__, [])
+                if len(idle) < SqlCursor._POOL_SIZE:
+                    idle.append(sql)
+                    return
+        except Exception as e:
+            print("SqlCursor::_release(): %s" % e)
+        sql.close()
@@ -15,17 +15,22 @@ gi.require_version('GstPbutils', '1.0')
 from gi.repository import GLib, Gst, GstPbutils
 
 import os
-
 from gettext import gettext as _
+from queue import Queue
+from threading import Thread
 
-from lollypop.define import Lp, Type
-from lollypop.utils import format_artist_name
+from lollypop.define import Lp
+from lollypop.tagreader_header import HeaderTagReader, HeaderTags
+from lollypop.utils import format_artist_name, debug
 
 
 class TagReader:
     """
         Read tags from file
     """
+    # Embedded covers saved by scanner, one file per album id
+    _EMBEDDED_PATH = os.path.expanduser("~") +\
+        "/.local/share/lollypop/embedded"
 
     def __init__(self):
         """
@@ -38,7 +43,8 @@ class TagReader:
             Init discover
         """
         GstPbutils.pb_utils_init()
-        self._tagreader = GstPbutils.Discoverer.new(10*Gst.SECOND)
+        timeout = Lp().settings.get_value('discover-timeout').get_int32()
+        self._tagreader = GstPbutils.Discoverer.new(timeout*Gst.SECOND)
 
     def get_infos(self, path):
         """
@@ -51,6 +57,146 @@ class TagReader:
         infos = self._tagreader.discover_uri(uri)
         return infos
 
+    def get_embedded_path(self, album_id):
+        """
+            Return path of embedded cover saved by scanner for album,
+            an empty file means album tracks have no embedded cover
+            @param album_id as int
+            @return str
+        """
+        return "%s/%d" % (self._EMBEDDED_PATH, album_id)
+
+
+class TagReaderPool:
+    """
+        Discover files in worker threads, each one with its own discoverer
+        Files can be split in lanes (one per device), each lane having its
+        own queue and workers so a slow device does not starve others.
+        Pool workers are split between lanes, each lane getting at least one
+    """
+
+    def __init__(self, count, headers):
+        """
+            Init pool
+            @param count as int, max workers for all lanes,
+                   0 for one worker per processor
+            @param headers as bool, read file headers before
+            falling back to a discoverer
+        """
+        if count <= 0:
+            count = os.cpu_count() or 1
+        self._count = count
+        self._headers = headers
+        self._queues = []
+        self._results = Queue()
+        self._threads = []
+        self._stopped = False
+
+    def discover(self, files, get_lane=None):
+        """
+            Discover files, results are returned in completion order.
+            A pool should only be used for one discovery
+            @param files as [(filepath as str, data)]
+            @param get_lane as function(filepath, data) returning
+                   (lane as hashable, max workers as int, 0 for no limit),
+                   one lane if None
+            @return iterator of (filepath as str, data,
+                                 infos as GstPbutils.DiscovererInfo,
+                                 error as Exception)
+            @thread safe
+        """
+        self._stopped = False
+        lanes = {}
+        for item in files:
+            if get_lane is None:
+                (lane, workers) = (None, 0)
+            else:
+                (lane, workers) = get_lane(*item)
+            if workers <= 0:
+                workers = self._count
+            if lane in lanes:
+                lanes[lane][1].append(item)
+            else:
+                lanes[lane] = (min(workers, self._count), [item])
+        (share, extra) = divmod(self._count, len(lanes) or 1)
+        for (index, (lane, (workers, items))) in enumerate(lanes.items()):
+            if index < extra:
+                workers = min(workers, share + 1)
+            else:
+                workers = min(workers, share)
+            workers = max(1, min(workers, len(items)))
+            debug("TagReaderPool::discover(): lane %s, %s files, "
+                  "%s workers" % (lane, len(items), workers))
+            queue = Queue()
+            for item in items:
+                queue.put(item)
+            self._queues.append(queue)
+            for i in range(0, workers):
+                queue.put(None)
+                thread = Thread(target=self._worker, args=(queue,))
+                thread.daemon = True
+                thread.start()
+                self._threads.append((thread, queue))
+        try:
+            for i in range(0, len(files)):
+                yield self._results.get()
+        finally:
+            self.stop()
+
+    def stop(self):
+        """
+            Stop workers, pending files are dropped
+        """
+        self._stopped = True
+        for queue in self._queues:
+            while not queue.empty():
+                queue.get()
+        for (thread, queue) in self._threads:
+            queue.put(None)
+        self._queues = []
+        self._threads = []
+
+#######################
+# PRIVATE             #
+#######################
+    def _worker(self, queue):
+        """
+            Discover queued files until stopped
+            @param queue as Queue
+        """
+        # Readers are only created if needed
+        tagreader = None
+        header_tagreader = None
+        # Each queued file must get a result, discover() waits for them
+        try:
+            Lp().background.set_low_priority()
+        except Exception as e:
+            print("TagReaderPool::_worker(): %s" % e)
+        while not self._stopped:
+            item = queue.get()
+            if item is None:
+                break
+            (filepath, data) = item
+            infos = None
+            error = None
+            try:
+                try:
+                    Lp().background.wait()
+                except Exception as e:
+                    print("TagReaderPool::_worker(): %s" % e)
+                if self._headers:
+                    if header_tagreader is None:
+                        header_tagreader = HeaderTagReader()
+                    infos = header_tagreader.get_infos(filepath)
+                if infos is None:
+                    if tagreader is None:
+                        tagreader = TagReader()
+                    infos = tagreader.get_infos(filepath)
+            except Exception as e:
+                error = e
+            finally:
+                self._results.put((filepath, data, infos, error))
+
 
 class ScannerTagReader(TagReader):
     """
@@ -63,6 +209,29 @@ class ScannerTagReader(TagReader):
         """
         TagReader.__init__(self)
 
+    def init_caches(self):
+        """
+            Load artists/genres/albums ids from db, so we do not have
+            to query db for each scanned track
+            Caches are updated by add_*() methods
+        """
+        self._artist_ids = Lp().artists.get_name_ids()
+        self._genre_ids = Lp().genres.get_name_ids()
+        # (name, artist id or None for compilations, year): album id
+        self._album_ids = {}
+        self._album_paths = {}
+        for (album_id, name, artist_id,
+             no_album_artist, year, path) in Lp().albums.get_keys():
+            if no_album_artist:
+                artist_id = None
+            key = (name, artist_id, year)
+            if key not in self._album_ids:
+                self._album_ids[key] = album_id
+            self._album_paths[album_id] = path
+        # Album id: track artist ids, for albums without album artist
+        self._compilation_artist_ids = \
+            Lp().albums.get_compilation_artist_ids()
+
     def get_title(self, tags, filepath):
         """
             Return title for tags
@@ -195,6 +364,27 @@ class ScannerTagReader(TagReader):
             year = None
         return year
 
+    def get_image(self, tags):
+        """
+            Return embedded image for tags
+            @param tags as Gst.TagList
+            @return image data as bytes or None
+        """
+        if tags is None:
+            return None
+        if isinstance(tags, HeaderTags):
+            return tags.get_image()
+        (exist, sample) = tags.get_sample_index('image', 0)
+        if not exist:
+            return None
+        buf = sample.get_buffer()
+        (exist, mapinfo) = buf.map(Gst.MapFlags.READ)
+        if not exist:
+            return None
+        data = bytes(mapinfo.data)
+        buf.unmap(mapinfo)
+        return data
+
     def add_artists(self, artists, album_artist):
         """
             Add artists to db
@@ -209,9 +399,10 @@ class ScannerTagReader(TagReader):
         for word in artists.split(';'):
             artist = format_artist_name(word)
             # Get artist id, add it if missing
-            artist_id = Lp().artists.get_id(artist)
+            artist_id = self._artist_ids.get(artist, None)
             if artist_id is None:
                 artist_id = Lp().artists.add(artist)
+                self._artist_ids[artist] = artist_id
                 if artist == album_artist:
                     new_artist_ids.append(artist_id)
             artist_ids.append(artist_id)
@@ -229,13 +420,14 @@ class ScannerTagReader(TagReader):
         if album_artist:
             album_artist = format_artist_name(album_artist)
             # Get album artist id, add it if missing
-            album_artist_id = Lp().artists.get_id(album_artist)
+            album_artist_id = self._artist_ids.get(album_artist, None)
             if album_artist_id is None:
                 album_artist_id = Lp().artists.add(album_artist)
+                self._artist_ids[album_artist] = album_artist_id
                 new = True
         return (album_artist_id, new)
 
-    def add_genres(self, genres, album_id):
+    def add_genres(self, genres):
         """
             Add genres to db
             @param genres as [string]
@@ -247,14 +439,12 @@ class ScannerTagReader(TagReader):
         new_genre_ids = []
         for genre in genres.split(';'):
             # Get genre id, add genre if missing
-            genre_id = Lp().genres.get_id(genre)
+            genre_id = self._genre_ids.get(genre, None)
             if genre_id is None:
                 genre_id = Lp().genres.add(genre)
+                self._genre_ids[genre] = genre_id
                 new_genre_ids.append(genre_id)
             genre_ids.append(genre_id)
-
-        for genre_id in genre_ids:
-            Lp().albums.add_genre(album_id, genre_id)
         return (genre_ids, new_genre_ids)
 
     def add_album(self, album_name, artist_id, no_album_artist,
@@ -270,43 +460,23 @@ class ScannerTagReader(TagReader):
             @param mtime as int
             @return (album id as int, new as bool)
             @commit needed
+            @warning: compilation artist id is handled by scanner
         """
         path = os.path.dirname(filepath)
         new = False
         if no_album_artist:
-            album_id = Lp().albums.get_compilation_id(album_name, year)
+            key = (album_name, None, year)
         else:
-            album_id = Lp().albums.get_non_compilation_id(album_name,
-                                                          artist_id,
-                                                          year)
+            key = (album_name, artist_id, year)
+        album_id = self._album_ids.get(key, None)
         if album_id is None:
             new = True
             album_id = Lp().albums.add(album_name, artist_id, no_album_artist,
                                        year, path, popularity, mtime)
+            self._album_ids[key] = album_id
+            self._album_paths[album_id] = path
         # Now we have our album id, check if path doesn't change
-        if Lp().albums.get_path(album_id) != path:
+        if self._album_paths[album_id] != path:
             Lp().albums.set_path(album_id, path)
-
-        # If no album artist, handle album artist id for compilations
-        if no_album_artist:
-            if Lp().albums.is_compilation(album_id):
-                Lp().albums.set_artist_id(album_id,
-                                          Type.COMPILATIONS)
-            else:
-                Lp().albums.set_artist_id(album_id,
-                                          artist_id)
+            self._album_paths[album_id] = path
         return (album_id, new)
-
-    def update_track(self, track_id, artist_ids, genre_ids):
-        """
-            Set track artists/genres
-            @param track id as int
-            @param artist ids as [int]
-            @param genre ids as [int]
-            @commit needed
-        """
-        # Set artists/genres for track
-        for artist_id in artist_ids:
-            Lp().tracks.add_artist(track_id, artist_id)
-        for genre_id in genre_ids:
-            Lp().tracks.add_genre(track_id, genre_id)
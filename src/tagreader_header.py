@@ -0,0 +1,809 @@
+# Copyright (c) 2014-2015 Cedric Bellegarde <cedric.bellegarde@adishatz.org>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+from base64 import b64decode
+from struct import unpack
+
+from lollypop.utils import debug
+
+
+# ID3v1 genres, as used by ID3v2 "(17)" references and MP4 gnre atoms
+_ID3_GENRES = [
+    "Blues", "Classic Rock", "Country", "Dance", "Disco", "Funk", "Grunge",
+    "Hip-Hop", "Jazz", "Metal", "New Age", "Oldies", "Other", "Pop", "R&B",
+    "Rap", "Reggae", "Rock", "Techno", "Industrial", "Alternative", "Ska",
+    "Death Metal", "Pranks", "Soundtrack", "Euro-Techno", "Ambient",
+    "Trip-Hop", "Vocal", "Jazz+Funk", "Fusion", "Trance", "Classical",
+    "Instrumental", "Acid", "House", "Game", "Sound Clip", "Gospel", "Noise",
+    "AlternRock", "Bass", "Soul", "Punk", "Space", "Meditative",
+    "Instrumental Pop", "Instrumental Rock", "Ethnic", "Gothic", "Darkwave",
+    "Techno-Industrial", "Electronic", "Pop-Folk", "Eurodance", "Dream",
+    "Southern Rock", "Comedy", "Cult", "Gangsta", "Top 40", "Christian Rap",
+    "Pop/Funk", "Jungle", "Native American", "Cabaret", "New Wave",
+    "Psychadelic", "Rave", "Showtunes", "Trailer", "Lo-Fi", "Tribal",
+    "Acid Punk", "Acid Jazz", "Polka", "Retro", "Musical", "Rock & Roll",
+    "Hard Rock", "Folk", "Folk-Rock", "National Folk", "Swing",
+    "Fast Fusion", "Bebob", "Latin", "Revival", "Celtic", "Bluegrass",
+    "Avantgarde", "Gothic Rock", "Progressive Rock", "Psychedelic Rock",
+    "Symphonic Rock", "Slow Rock", "Big Band", "Chorus", "Easy Listening",
+    "Acoustic", "Humour", "Speech", "Chanson", "Opera", "Chamber Music",
+    "Sonata", "Symphony", "Booty Bass", "Primus", "Porn Groove", "Satire",
+    "Slow Jam", "Club", "Tango", "Samba", "Folklore", "Ballad",
+    "Power Ballad", "Rhythmic Soul", "Freestyle", "Duet", "Punk Rock",
+    "Drum Solo", "A capella", "Euro-House", "Dance Hall"]
+
+# Tag frames to GStreamer tag names
+_ID3_FRAMES = {
+    "TIT2": "title", "TT2": "title",
+    "TPE1": "artist", "TP1": "artist",
+    "TPE2": "album-artist", "TP2": "album-artist",
+    "TALB": "album", "TAL": "album",
+    "TCON": "genre", "TCO": "genre",
+    "TRCK": "track-number", "TRK": "track-number",
+    "TPOS": "album-disc-number", "TPA": "album-disc-number",
+    "TDRC": "date", "TYER": "date", "TYE": "date",
+    "APIC": "image", "PIC": "image"}
+_VORBIS_FIELDS = {
+    "TITLE": "title",
+    "ARTIST": "artist",
+    "ALBUMARTIST": "album-artist",
+    "ALBUM ARTIST": "album-artist",
+    "ALBUM_ARTIST": "album-artist",
+    "ALBUM": "album",
+    "GENRE": "genre",
+    "TRACKNUMBER": "track-number",
+    "DISCNUMBER": "album-disc-number",
+    "DATE": "date",
+    "YEAR": "date"}
+_MP4_ATOMS = {
+    b"\xa9nam": "title",
+    b"\xa9ART": "artist",
+    b"aART": "album-artist",
+    b"\xa9alb": "album",
+    b"\xa9gen": "genre",
+    b"gnre": "genre",
+    b"trkn": "track-number",
+    b"disk": "album-disc-number",
+    b"\xa9day": "date",
+    b"covr": "image"}
+
+# MPEG audio, kbps by [version][layer][index], version 1 or 2 (2.5 too)
+_MPEG_BITRATES = {
+    (1, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384,
+             416, 448],
+    (1, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320,
+             384],
+    (1, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256,
+             320],
+    (2, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224,
+             256],
+    (2, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (2, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160]}
+# Sample rates by version bits
+_MPEG_RATES = {0: (11025, 12000, 8000),
+               2: (22050, 24000, 16000),
+               3: (44100, 48000, 32000)}
+
+
+class HeaderDate:
+    """
+        Date read from headers, like a GLib.Date
+    """
+
+    def __init__(self, year):
+        """
+            Init date
+            @param year as int
+        """
+        self._year = year
+
+    def get_year(self):
+        """
+            Return year
+            @return int
+        """
+        return self._year
+
+
+class HeaderTags:
+    """
+        Tags read from headers, same accessors as a Gst.TagList
+        for tags used by scanner
+    """
+
+    def __init__(self):
+        """
+            Init tags
+        """
+        self._tags = {}
+        self._image = None
+        self._image_is_cover = False
+
+    def add(self, name, value):
+        """
+            Add value for tag, numbers and dates are parsed from string
+            @param name as str
+            @param value as str/int
+        """
+        if isinstance(value, str):
+            value = value.strip("\x00 \t\r\n")
+            if not value:
+                return
+            if name in ["track-number", "album-disc-number"]:
+                value = value.split("/")[0].strip()
+                if not value.isdigit():
+                    return
+                value = int(value)
+            elif name == "date":
+                if len(value) < 4 or not value[0:4].isdigit():
+                    return
+                value = HeaderDate(int(value[0:4]))
+        if name in self._tags:
+            self._tags[name].append(value)
+        else:
+            self._tags[name] = [value]
+
+    def add_image(self, data, is_cover):
+        """
+            Add embedded image, front cover is preferred
+            @param data as bytes
+            @param is_cover as bool, True if image is front cover
+        """
+        if data and (self._image is None or
+                     (is_cover and not self._image_is_cover)):
+            self._image = data
+            self._image_is_cover = is_cover
+
+    def get_image(self):
+        """
+            Return embedded image
+            @return bytes or None
+        """
+        return self._image
+
+    def is_empty(self):
+        """
+            True if no tags
+            @return bool
+        """
+        return not self._tags and self._image is None
+
+    def get_tag_size(self, name):
+        """
+            Return value count for tag
+            @param name as str
+            @return int
+        """
+        return len(self._tags.get(name, []))
+
+    def get_string_index(self, name, index):
+        """
+            Return string value
+            @param name as str
+            @param index as int
+            @return (exist as bool, value as str)
+        """
+        return self._get_index(name, index)
+
+    def get_uint_index(self, name, index):
+        """
+            Return int value
+            @param name as str
+            @param index as int
+            @return (exist as bool, value as int)
+        """
+        return self._get_index(name, index)
+
+    def get_date(self, name):
+        """
+            Return date value
+            @param name as str
+            @return (exist as bool, value as HeaderDate)
+        """
+        return self._get_index(name, 0)
+
+    def get_date_time(self, name):
+        """
+            Return date time value
+            @param name as str
+            @return (exist as bool, value as HeaderDate)
+        """
+        return self._get_index(name, 0)
+
+#######################
+# PRIVATE             #
+#######################
+    def _get_index(self, name, index):
+        """
+            Return value at index
+            @param name as str
+            @param index as int
+            @return (exist as bool, value)
+        """
+        values = self._tags.get(name, [])
+        if index < len(values):
+            return (True, values[index])
+        return (False, None)
+
+
+class HeaderInfos:
+    """
+        Informations read from headers, same accessors as a
+        GstPbutils.DiscovererInfo for informations used by scanner
+    """
+
+    def __init__(self, tags, duration):
+        """
+            Init infos
+            @param tags as HeaderTags
+            @param duration in seconds as float
+        """
+        self._tags = tags
+        self._duration = duration
+
+    def get_tags(self):
+        """
+            Return tags, None if file has no tags
+            @return HeaderTags
+        """
+        if self._tags.is_empty():
+            return None
+        return self._tags
+
+    def get_duration(self):
+        """
+            Return duration
+            @return duration in nanoseconds as int
+        """
+        return int(self._duration * 1000000000)
+
+
+class HeaderTagReader:
+    """
+        Read tags and duration from MP3, FLAC, Ogg and MP4 headers
+        without a GStreamer pipeline
+    """
+
+    # Bytes read at file start, enough for most tags
+    _HEAD_SIZE = 65536
+
+    def __init__(self):
+        """
+            Init tag reader
+        """
+        pass
+
+    def get_infos(self, path):
+        """
+            Return informations on file at path
+            @param path as str
+            @return HeaderInfos, None if file can't be parsed
+        """
+        try:
+            with open(path, "rb") as f:
+                head = f.read(10)
+                f.seek(0)
+                if head[0:3] == b"ID3":
+                    size = self._syncsafe(head[6:10]) + 10
+                    if head[5] & 0x10:
+                        size += 10
+                    f.seek(size)
+                    magic = f.read(4)
+                    f.seek(0)
+                    if magic == b"fLaC":
+                        return self._read_flac(f, size)
+                    return self._read_mpeg(f)
+                elif head[0:4] == b"fLaC":
+                    return self._read_flac(f, 0)
+                elif head[0:4] == b"OggS":
+                    return self._read_ogg(f)
+                elif head[4:8] == b"ftyp":
+                    return self._read_mp4(f)
+                elif len(head) > 1 and head[0] == 0xff and\
+                        head[1] & 0xe0 == 0xe0:
+                    return self._read_mpeg(f)
+        except Exception as e:
+            debug("HeaderTagReader::get_infos(): %s, %s" % (path, e))
+        return None
+
+#######################
+# PRIVATE             #
+#######################
+    def _syncsafe(self, data):
+        """
+            Decode a syncsafe integer
+            @param data as bytes
+            @return int
+        """
+        value = 0
+        for byte in data:
+            value = (value << 7) | (byte & 0x7f)
+        return value
+
+    def _decode_text(self, encoding, data):
+        """
+            Decode ID3v2 text
+            @param encoding as int
+            @param data as bytes
+            @return [str]
+        """
+        if encoding in [1, 2] and len(data) % 2:
+            data = data[:-1]
+        if encoding == 1:
+            text = data.decode("utf-16")
+        elif encoding == 2:
+            text = data.decode("utf-16-be")
+        elif encoding == 3:
+            text = data.decode("utf-8", "replace")
+        else:
+            text = data.decode("latin-1")
+        # ID3v2.4 separates values with NULL, each one with its own BOM
+        return [value.lstrip("\ufeff") for value in text.split("\x00")
+                if value.lstrip("\ufeff")]
+
+    def _read_id3v2(self, f, tags):
+        """
+            Read ID3v2 tag at file start
+            @param f as file
+            @param tags as HeaderTags
+            @return tag size as int
+        """
+        header = f.read(10)
+        if header[0:3] != b"ID3":
+            f.seek(0)
+            return 0
+        version = header[3]
+        flags = header[5]
+        size = self._syncsafe(header[6:10])
+        data = f.read(size)
+        if flags & 0x80 and version < 4:
+            data = data.replace(b"\xff\x00", b"\xff")
+        pos = 0
+        if flags & 0x40 and version >= 3:
+            if version == 3:
+                pos = unpack(">I", data[0:4])[0] + 4
+            else:
+                pos = self._syncsafe(data[0:4])
+        if version == 2:
+            (id_size, header_size) = (3, 6)
+        else:
+            (id_size, header_size) = (4, 10)
+        while pos + header_size <= len(data):
+            frame_id = data[pos:pos + id_size]
+            if frame_id[0:1] in [b"\x00", b""]:
+                break
+            if version == 2:
+                frame_size = unpack(">I", b"\x00" + data[pos + 3:pos + 6])[0]
+                frame_flags = 0
+            elif version == 3:
+                frame_size = unpack(">I", data[pos + 4:pos + 8])[0]
+                frame_flags = unpack(">H", data[pos + 8:pos + 10])[0]
+            else:
+                frame_size = self._syncsafe(data[pos + 4:pos + 8])
+                frame_flags = unpack(">H", data[pos + 8:pos + 10])[0]
+            frame = data[pos + header_size:pos + header_size + frame_size]
+            pos += header_size + frame_size
+            name = _ID3_FRAMES.get(frame_id.decode("latin-1"))
+            if name is None or not frame:
+                continue
+            # Compressed or encrypted
+            if (version == 3 and frame_flags & 0x00c0) or\
+                    (version == 4 and frame_flags & 0x000c):
+                continue
+            if version == 4:
+                if frame_flags & 0x0001:
+                    frame = frame[4:]
+                if frame_flags & 0x0002:
+                    frame = frame.replace(b"\xff\x00", b"\xff")
+            if name == "image":
+                self._read_id3_picture(frame, version, tags)
+                continue
+            for value in self._decode_text(frame[0], frame[1:]):
+                if name == "genre":
+                    value = self._get_id3_genre(value)
+                tags.add(name, value)
+        return size + 10 + (10 if flags & 0x10 else 0)
+
+    def _read_id3_picture(self, frame, version, tags):
+        """
+            Read ID3v2 picture frame
+            @param frame as bytes
+            @param version as int
+            @param tags as HeaderTags
+        """
+        encoding = frame[0]
+        # Image format on three bytes in ID3v2.2, mime type otherwise
+        if version == 2:
+            pos = 4
+        else:
+            pos = frame.index(b"\x00", 1) + 1
+        picture_type = frame[pos]
+        pos += 1
+        # Skip description
+        if encoding in [1, 2]:
+            while frame[pos:pos + 2] not in [b"\x00\x00", b""]:
+                pos += 2
+            pos += 2
+        else:
+            pos = frame.index(b"\x00", pos) + 1
+        tags.add_image(frame[pos:], picture_type == 3)
+
+    def _read_flac_picture(self, data, tags):
+        """
+            Read a FLAC picture block
+            @param data as bytes
+            @param tags as HeaderTags
+        """
+        picture_type = unpack(">I", data[0:4])[0]
+        mime_size = unpack(">I", data[4:8])[0]
+        pos = 8 + mime_size
+        description_size = unpack(">I", data[pos:pos + 4])[0]
+        # Skip description, width, height, depth and colors
+        pos += 4 + description_size + 16
+        size = unpack(">I", data[pos:pos + 4])[0]
+        tags.add_image(data[pos + 4:pos + 4 + size], picture_type == 3)
+
+    def _get_id3_genre(self, value):
+        """
+            Return genre name for ID3v1 references like "(17)" or "17"
+            @param value as str
+            @return str
+        """
+        if value.startswith("(") and ")" in value:
+            ref = value[1:value.index(")")]
+            rest = value[value.index(")") + 1:]
+            if rest:
+                return rest
+            value = ref
+        if value.isdigit() and int(value) < len(_ID3_GENRES):
+            return _ID3_GENRES[int(value)]
+        return value
+
+    def _read_id3v1(self, f, tags):
+        """
+            Read ID3v1 tag at file end
+            @param f as file
+            @param tags as HeaderTags
+            @return tag size as int
+        """
+        f.seek(-128, os.SEEK_END)
+        data = f.read(128)
+        if data[0:3] != b"TAG":
+            return 0
+        if tags.is_empty():
+            tags.add("title", data[3:33].decode("latin-1"))
+            tags.add("artist", data[33:63].decode("latin-1"))
+            tags.add("album", data[63:93].decode("latin-1"))
+            tags.add("date", data[93:97].decode("latin-1"))
+            if data[125] == 0 and data[126] != 0:
+                tags.add("track-number", data[126])
+            if data[127] < len(_ID3_GENRES):
+                tags.add("genre", _ID3_GENRES[data[127]])
+        return 128
+
+    def _read_vorbis_comment(self, data, tags):
+        """
+            Read a vorbis comment block
+            @param data as bytes
+            @param tags as HeaderTags
+        """
+        vendor_size = unpack("<I", data[0:4])[0]
+        pos = 4 + vendor_size
+        count = unpack("<I", data[pos:pos + 4])[0]
+        pos += 4
+        for i in range(0, count):
+            size = unpack("<I", data[pos:pos + 4])[0]
+            comment = data[pos + 4:pos + 4 + size].decode("utf-8", "replace")
+            pos += 4 + size
+            if "=" not in comment:
+                continue
+            (key, value) = comment.split("=", 1)
+            key = key.upper()
+            name = _VORBIS_FIELDS.get(key)
+            if name is not None:
+                tags.add(name, value)
+            elif key == "METADATA_BLOCK_PICTURE":
+                self._read_flac_picture(b64decode(value), tags)
+            elif key == "COVERART":
+                tags.add_image(b64decode(value), False)
+
+    def _read_mpeg(self, f):
+        """
+            Read MPEG audio file
+            @param f as file
+            @return HeaderInfos
+        """
+        tags = HeaderTags()
+        start = self._read_id3v2(f, tags)
+        f.seek(start)
+        data = f.read(self._HEAD_SIZE)
+        file_size = os.fstat(f.fileno()).st_size
+        end = file_size - self._read_id3v1(f, tags)
+        # Find first valid frame
+        pos = data.find(b"\xff")
+        while pos != -1 and pos + 4 <= len(data):
+            frame = self._parse_mpeg_header(data[pos:pos + 4])
+            if frame is not None:
+                # Check next frame, sync bits may be found in garbage
+                (version, layer, bitrate, rate, samples,
+                 mono, length) = frame
+                following = data[pos + length:pos + length + 4]
+                if len(following) < 4 or\
+                        self._parse_mpeg_header(following) is not None:
+                    break
+            pos = data.find(b"\xff", pos + 1)
+        else:
+            return None
+        # Xing/Info header for VBR files
+        if version == 3:
+            offset = 17 if mono else 32
+        else:
+            offset = 9 if mono else 17
+        xing = data[pos + 4 + offset:pos + 4 + offset + 12]
+        if xing[0:4] in [b"Xing", b"Info"] and\
+                unpack(">I", xing[4:8])[0] & 0x01:
+            frames = unpack(">I", xing[8:12])[0]
+            return HeaderInfos(tags, frames * samples / rate)
+        vbri = data[pos + 36:pos + 36 + 18]
+        if vbri[0:4] == b"VBRI":
+            frames = unpack(">I", vbri[14:18])[0]
+            return HeaderInfos(tags, frames * samples / rate)
+        # CBR
+        audio_size = end - start - pos
+        return HeaderInfos(tags, audio_size * 8 / (bitrate * 1000))
+
+    def _parse_mpeg_header(self, header):
+        """
+            Parse MPEG audio frame header
+            @param header as bytes
+            @return (version bits, layer, bitrate in kbps, sample rate,
+                     samples per frame, mono as bool, frame length)
+                     or None if not a valid header
+        """
+        if header[0] != 0xff or header[1] & 0xe0 != 0xe0:
+            return None
+        version = (header[1] >> 3) & 0x03
+        layer = 4 - ((header[1] >> 1) & 0x03)
+        bitrate_index = header[2] >> 4
+        rate_index = (header[2] >> 2) & 0x03
+        if version == 1 or layer == 4 or bitrate_index in [0, 15] or\
+                rate_index == 3:
+            return None
+        padding = (header[2] >> 1) & 0x01
+        mono = (header[3] >> 6) == 3
+        bitrate = _MPEG_BITRATES[(1 if version == 3 else 2,
+                                  layer)][bitrate_index]
+        rate = _MPEG_RATES[version][rate_index]
+        if layer == 1:
+            samples = 384
+            length = (12 * bitrate * 1000 // rate + padding) * 4
+        elif layer == 3 and version != 3:
+            samples = 576
+            length = 72 * bitrate * 1000 // rate + padding
+        else:
+            samples = 1152
+            length = 144 * bitrate * 1000 // rate + padding
+        return (version, layer, bitrate, rate, samples, mono, length)
+
+    def _read_flac(self, f, start):
+        """
+            Read FLAC file
+            @param f as file
+            @param start as int, FLAC stream start
+            @return HeaderInfos
+        """
+        tags = HeaderTags()
+        f.seek(start + 4)
+        duration = None
+        last = False
+        while not last:
+            header = f.read(4)
+            if len(header) < 4:
+                break
+            last = header[0] & 0x80
+            block_type = header[0] & 0x7f
+            size = unpack(">I", b"\x00" + header[1:4])[0]
+            if block_type == 0:
+                data = f.read(size)
+                value = unpack(">Q", data[10:18])[0]
+                rate = value >> 44
+                samples = value & 0xfffffffff
+                if rate and samples:
+                    duration = samples / rate
+            elif block_type == 4:
+                self._read_vorbis_comment(f.read(size), tags)
+            elif block_type == 6:
+                self._read_flac_picture(f.read(size), tags)
+            else:
+                f.seek(size, os.SEEK_CUR)
+        if duration is None:
+            return None
+        return HeaderInfos(tags, duration)
+
+    def _read_ogg_packets(self, f, count):
+        """
+            Read first packets of first logical stream
+            @param f as file
+            @param count as int
+            @return ([bytes], serial as int)
+        """
+        packets = []
+        packet = b""
+        serial = None
+        while len(packets) < count:
+            header = f.read(27)
+            if len(header) < 27 or header[0:4] != b"OggS":
+                break
+            page_serial = unpack("<I", header[14:18])[0]
+            segments = f.read(header[26])
+            data = f.read(sum(segments))
+            if serial is None:
+                serial = page_serial
+            elif page_serial != serial:
+                continue
+            pos = 0
+            for segment in segments:
+                packet += data[pos:pos + segment]
+                pos += segment
+                if segment < 255:
+                    packets.append(packet)
+                    packet = b""
+        return (packets, serial)
+
+    def _read_ogg(self, f):
+        """
+            Read Ogg Vorbis/Opus file
+            @param f as file
+            @return HeaderInfos
+        """
+        tags = HeaderTags()
+        (packets, serial) = self._read_ogg_packets(f, 2)
+        if len(packets) < 2:
+            return None
+        if packets[0][0:7] == b"\x01vorbis" and\
+                packets[1][0:7] == b"\x03vorbis":
+            rate = unpack("<I", packets[0][12:16])[0]
+            skip = 0
+            self._read_vorbis_comment(packets[1][7:], tags)
+        elif packets[0][0:8] == b"OpusHead" and\
+                packets[1][0:8] == b"OpusTags":
+            rate = 48000
+            skip = unpack("<H", packets[0][10:12])[0]
+            self._read_vorbis_comment(packets[1][8:], tags)
+        else:
+            return None
+        # Last granule position gives sample count
+        size = os.fstat(f.fileno()).st_size
+        f.seek(max(0, size - self._HEAD_SIZE))
+        data = f.read()
+        pos = data.rfind(b"OggS")
+        while pos != -1:
+            header = data[pos:pos + 27]
+            if len(header) == 27 and\
+                    unpack("<I", header[14:18])[0] == serial:
+                granule = unpack("<q", header[6:14])[0]
+                if granule > 0 and rate:
+                    return HeaderInfos(tags, (granule - skip) / rate)
+            pos = data.rfind(b"OggS", 0, pos)
+        return None
+
+    def _get_mp4_atoms(self, f, end):
+        """
+            Iterate over atoms until end
+            @param f as file
+            @param end as int
+            @return iterator of (type as bytes, data start as int,
+                                 data size as int)
+        """
+        pos = f.tell()
+        while pos + 8 <= end:
+            f.seek(pos)
+            header = f.read(8)
+            if len(header) < 8:
+                break
+            (size, atom_type) = unpack(">I4s", header)
+            header_size = 8
+            if size == 1:
+                size = unpack(">Q", f.read(8))[0]
+                header_size = 16
+            elif size == 0:
+                size = end - pos
+            if size < header_size:
+                break
+            yield (atom_type, pos + header_size, size - header_size)
+            pos += size
+
+    def _read_mp4(self, f):
+        """
+            Read MP4 audio file
+            @param f as file
+            @return HeaderInfos
+        """
+        tags = HeaderTags()
+        duration = None
+        size = os.fstat(f.fileno()).st_size
+        for (atom_type, start, length) in self._get_mp4_atoms(f, size):
+            if atom_type == b"moov":
+                f.seek(start)
+                moov = f.read(length)
+                break
+        else:
+            return None
+        for (atom_type, data) in self._get_mp4_children(moov):
+            if atom_type == b"mvhd":
+                if data[0] == 1:
+                    (timescale, value) = unpack(">IQ", data[20:32])
+                else:
+                    (timescale, value) = unpack(">II", data[12:20])
+                if timescale:
+                    duration = value / timescale
+            elif atom_type == b"udta":
+                for (child_type, child) in self._get_mp4_children(data):
+                    if child_type == b"meta":
+                        self._read_mp4_meta(child, tags)
+        if duration is None:
+            return None
+        return HeaderInfos(tags, duration)
+
+    def _get_mp4_children(self, data):
+        """
+            Iterate over atoms in data
+            @param data as bytes
+            @return iterator of (type as bytes, data as bytes)
+        """
+        pos = 0
+        while pos + 8 <= len(data):
+            (size, atom_type) = unpack(">I4s", data[pos:pos + 8])
+            header_size = 8
+            if size == 1:
+                size = unpack(">Q", data[pos + 8:pos + 16])[0]
+                header_size = 16
+            elif size == 0:
+                size = len(data) - pos
+            if size < header_size:
+                break
+            yield (atom_type, data[pos + header_size:pos + size])
+            pos += size
+
+    def _read_mp4_meta(self, data, tags):
+        """
+            Read iTunes metadata
+            @param data as bytes, meta atom content
+            @param tags as HeaderTags
+        """
+        # Full atom, except in some QuickTime files
+        if data[4:8] != b"hdlr":
+            data = data[4:]
+        for (atom_type, ilst) in self._get_mp4_children(data):
+            if atom_type != b"ilst":
+                continue
+            for (item_type, item) in self._get_mp4_children(ilst):
+                name = _MP4_ATOMS.get(item_type)
+                if name is None:
+                    continue
+                for (child_type, child) in self._get_mp4_children(item):
+                    if child_type != b"data":
+                        continue
+                    value = child[8:]
+                    if name == "image":
+                        tags.add_image(value, True)
+                    elif name in ["track-number", "album-disc-number"]:
+                        if len(value) >= 4:
+                            tags.add(name, unpack(">H", value[2:4])[0])
+                    elif item_type == b"gnre":
+                        if len(value) >= 2:
+                            index = unpack(">H", value[0:2])[0] - 1
+                            if 0 <= index < len(_ID3_GENRES):
+                                tags.add(name, _ID3_GENRES[index])
+                    else:
+                        tags.add(name, value.decode("utf-8", "replace"))
@@ -19,7 +19,7 @@ import socket
 import fcntl
 import struct
 
-from lollypop.define import Lp, Type
+from lollypop.define import Lp, Type, FileType
 from lollypop.objects import Track
 
 
@@ -91,6 +91,73 @@ def is_pls(f):
     return False
 
 
+# Content type is only sniffed for files with other extensions
+_AUDIO_EXTENSIONS = {".mp3", ".mp2", ".ogg", ".oga", ".opus", ".spx", ".flac",
+                     ".m4a", ".m4b", ".mp4", ".aac", ".wma", ".wav", ".aif",
+                     ".aiff", ".ape", ".wv", ".mpc", ".tta", ".mka", ".ac3",
+                     ".dsf", ".dff"}
+_PLS_EXTENSIONS = {".m3u", ".m3u8", ".xspf", ".pls"}
+_OTHER_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".bmp", ".tif", ".tiff",
+                     ".txt", ".nfo", ".log", ".cue", ".pdf", ".sfv", ".md5",
+                     ".accurip", ".lrc", ".ini", ".db", ".url", ".htm",
+                     ".html"}
+
+
+def get_file_type_by_extension(filepath):
+    """
+        Return file type from its extension
+        @param filepath as str
+        @return FileType or None if extension is unknown
+    """
+    ext = os.path.splitext(filepath)[1].lower()
+    if ext in _AUDIO_EXTENSIONS:
+        return FileType.AUDIO
+    elif ext in _PLS_EXTENSIONS:
+        return FileType.PLS
+    elif ext in _OTHER_EXTENSIONS:
+        return FileType.NONE
+    return None
+
+
+def get_file_type(f):
+    """
+        Return file type by sniffing its content type
+        @param f as Gio.File
+        @return FileType
+    """
+    try:
+        info = f.query_info('standard::content-type',
+                            Gio.FileQueryInfoFlags.NONE)
+        if info is not None:
+            content_type = info.get_content_type()
+            if content_type in ["audio/x-mpegurl", "application/xspf+xml"]:
+                return FileType.PLS
+            elif content_type[0:6] == "audio/" or\
+                    content_type == "video/mp4":
+                return FileType.AUDIO
+    except:
+        pass
+    return FileType.NONE
+
+
+def is_rotational(device):
+    """
+        Check if block device is a spinning disk
+        @param device as int, st_dev
+        @return bool, False if unknown (network, virtual fs)
+    """
+    path = "/sys/dev/block/%s:%s" % (os.major(device), os.minor(device))
+    # Partitions have no queue, use parent disk one
+    for queue in [path + "/queue/rotational",
+                  path + "/../queue/rotational"]:
+        try:
+            with open(queue, "r") as f:
+                return f.read().strip() == "1"
+        except:
+            pass
+    return False
+
+
 def format_artist_name(name):
     """
         Return formated artist name
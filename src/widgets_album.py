@@ -327,11 +327,12 @@ class AlbumDetailedWidget(Gtk.Bin, AlbumWidget):
         """
         self._stop = False
         for disc in self._discs:
-            mid_tracks = int(0.5 + len(disc.tracks) / 2)
-            self.populate_list_left(disc.tracks[:mid_tracks],
+            tracks = disc.tracks
+            mid_tracks = int(0.5 + len(tracks) / 2)
+            self.populate_list_left(tracks[:mid_tracks],
                                     disc,
                                     1)
-            self.populate_list_right(disc.tracks[mid_tracks:],
+            self.populate_list_right(tracks[mid_tracks:],
                                      disc,
                                      mid_tracks + 1)
 
@@ -19,7 +19,7 @@ from gettext import gettext as _
 from lollypop.define import Lp, Type
 from lollypop.cellrendereralbum import CellRendererAlbum
 from lollypop.widgets_track import TracksWidget
-from lollypop.objects import Track
+from lollypop.objects import Track, load_tracks
 
 
 class PlaylistWidget(Gtk.Bin):
@@ -71,7 +71,7 @@ class PlaylistWidget(Gtk.Bin):
         """
         self._stop = False
         GLib.idle_add(self._add_tracks,
-                      tracks,
+                      load_tracks(tracks),
                       self._tracks_widget1,
                       pos)
 
@@ -84,7 +84,7 @@ class PlaylistWidget(Gtk.Bin):
         """
         self._stop = False
         GLib.idle_add(self._add_tracks,
-                      tracks,
+                      load_tracks(tracks),
                       self._tracks_widget2,
                       pos)
 
@@ -117,7 +117,7 @@ class PlaylistWidget(Gtk.Bin):
     def _add_tracks(self, tracks, widget, pos, previous_album_id=None):
         """
             Add tracks to list
-            @param tracks id as array of [int]
+            @param tracks as [Track]
             @param widget TracksWidget
             @param track position as int
             @param previous album id as int
@@ -125,7 +125,7 @@ class PlaylistWidget(Gtk.Bin):
         if not tracks or self._stop:
             return
 
-        track = Track(tracks.pop(0))
+        track = tracks.pop(0)
         name = escape(track.name)
         album = track.album
 
@@ -507,15 +507,15 @@ class PlaylistEditWidget(Gtk.Bin):
             Append tracks
         """
         track_ids = Lp().playlists.get_tracks_ids(self._playlist_id)
-        GLib.idle_add(self._append_track, track_ids)
+        GLib.idle_add(self._append_track, load_tracks(track_ids))
 
-    def _append_track(self, track_ids):
+    def _append_track(self, tracks):
         """
             Append track while tracks not empty
-            @param track_ids as [track_id as int]
+            @param tracks as [Track]
         """
-        if track_ids:
-            track = Track(track_ids.pop(0))
+        if tracks:
+            track = tracks.pop(0)
             if track.album.artist_id == Type.COMPILATIONS:
                 artist_name = track.artist_names
             else:
@@ -525,7 +525,7 @@ class PlaylistEditWidget(Gtk.Bin):
                                    escape(artist_name),
                                    escape(track.name)),
                                 'user-trash-symbolic', track.id])
-            GLib.idle_add(self._append_track, track_ids)
+            GLib.idle_add(self._append_track, tracks)
         else:
             self._view.grab_focus()
             self._in_thread = False